@@ -0,0 +1,164 @@
+#!/usr/bin/env bash
+#
+# script to check that the .wpt and list file caches and the update
+# state are never used for anything that files changed since they were
+# written could affect: it builds a tiny HighwayData and UserData
+# tree, runs siteupdate.py with caches and an update state, then
+# changes a .wpt file, runs with -e, runs again incrementally, changes
+# a list file and runs again, and runs once more with nothing changed,
+# and compares the results of each incremental run with those of a run
+# without caches or state on the same files.  Any arguments are passed
+# to every run of siteupdate.py, such as -p 2 to check worker processes
+#
+set -e
+testdir=`mktemp -d`
+siteupdate=`pwd`/siteupdate.py
+trap "/bin/rm -rf $testdir" EXIT
+
+hwy=$testdir/HighwayData
+users=$testdir/UserData/list_files
+mkdir -p $hwy/hwy_data/_systems $hwy/hwy_data/NY/usai $hwy/hwy_data/NY/usany $hwy/graphs $users
+cat > $hwy/continents.csv <<EOF
+code;name
+NA;North America
+EOF
+cat > $hwy/countries.csv <<EOF
+code;name
+USA;United States
+EOF
+cat > $hwy/regions.csv <<EOF
+code;name;country;continent;regionType
+NY;New York;USA;NA;State
+EOF
+cat > $hwy/systems.csv <<EOF
+System;CountryCode;Name;Color;Tier;Level
+usai;USA;Interstate Highways;blue;1;active
+usany;USA;New York State Highways;brown;3;preview
+EOF
+cat > $hwy/systemupdates.csv <<EOF
+date;region;systemName;description;statusChange
+EOF
+cat > $hwy/updates.csv <<EOF
+date;region;route;root;description
+EOF
+cat > $hwy/datacheckfps.csv <<EOF
+Root;Waypoint1;Waypoint2;Waypoint3;Error;Info
+EOF
+touch $hwy/nmpfps.log
+cat > $hwy/hwy_data/_systems/usai.csv <<EOF
+System;Region;Route;Banner;Abbrev;City;Root;AltRouteNames
+usai;NY;I-1;;;;ny.i1;
+usai;NY;I-2;;;;ny.i2;
+EOF
+cat > $hwy/hwy_data/_systems/usai_con.csv <<EOF
+System;Route;Banner;Groupname;Root(s)
+usai;I-1;;;ny.i1
+usai;I-2;;;ny.i2
+EOF
+cat > $hwy/hwy_data/_systems/usany.csv <<EOF
+System;Region;Route;Banner;Abbrev;City;Root;AltRouteNames
+usany;NY;NY5;;;;ny.ny005;
+usany;NY;NY7;;;;ny.ny007;
+EOF
+cat > $hwy/hwy_data/_systems/usany_con.csv <<EOF
+System;Route;Banner;Groupname;Root(s)
+usany;NY5;;;ny.ny005
+usany;NY7;;;ny.ny007
+EOF
+cat > $hwy/graphs/areagraphs.csv <<EOF
+Name;Base;Latitude;Longitude;Radius
+Binghamton;bing;42.0;-75.9;20
+EOF
+cat > $hwy/graphs/systemgraphs.csv <<EOF
+System
+usai
+EOF
+cat > $hwy/graphs/multisystem.csv <<EOF
+Name;Filename;Systems
+Interstates and NY Highways;ny-multi;usai,usany
+EOF
+cat > $hwy/graphs/multiregion.csv <<EOF
+Name;Filename;Regions
+New York;ny-multiregion;NY
+EOF
+cat > $hwy/hwy_data/NY/usany/ny.ny005.wpt <<EOF
+1 http://www.openstreetmap.org/?lat=41.000000&lon=-76.900000
+2 http://www.openstreetmap.org/?lat=41.050000&lon=-76.950000
+EOF
+# NY7 runs concurrently with I-1 from its point 2 to its point 3
+cat > $hwy/hwy_data/NY/usany/ny.ny007.wpt <<EOF
+1 http://www.openstreetmap.org/?lat=41.950000&lon=-75.950000
+2 http://www.openstreetmap.org/?lat=42.010000&lon=-75.800000
+3 http://www.openstreetmap.org/?lat=42.030000&lon=-75.750000
+4 http://www.openstreetmap.org/?lat=42.100000&lon=-75.700000
+EOF
+cat > $hwy/hwy_data/NY/usai/ny.i1.wpt <<EOF
+1 http://www.openstreetmap.org/?lat=42.000000&lon=-75.900000
+2 http://www.openstreetmap.org/?lat=42.010000&lon=-75.800000
+3 http://www.openstreetmap.org/?lat=42.030000&lon=-75.750000
+4 http://www.openstreetmap.org/?lat=42.070000&lon=-75.600000
+EOF
+cat > $hwy/hwy_data/NY/usai/ny.i2.wpt <<EOF
+1 http://www.openstreetmap.org/?lat=41.000000&lon=-75.900000
+2 http://www.openstreetmap.org/?lat=41.100000&lon=-75.900000
+EOF
+cat > $users/tester.list <<EOF
+NY I-1 2 4
+NY I-2 1 2
+NY NY5 1 2
+EOF
+cat > $users/other.list <<EOF
+NY I-1 1 3
+NY I-2 1 2
+EOF
+
+# run siteupdate.py on the test data with output in directory $1
+run() {
+    out=$testdir/$1
+    shift
+    mkdir -p $out/logs/users $out/stats $out/graphs
+    (cd $out; $siteupdate -w $hwy -u $users -l logs -c stats -g graphs -d TravelMapping $extra "$@" > siteupdate.log 2>&1)
+}
+
+# compare everything but creation times and run time profiles in the
+# output of run $1 with that of run $2
+status=0
+compare() {
+    for file in `cd $testdir/$2; find logs stats graphs TravelMapping.sql -type f ! -name '*.json'`; do
+	if ! diff -q <(grep -v -e '^Log file created at: ' -e 'mileage as of ' $testdir/$2/$file) <(grep -v -e '^Log file created at: ' -e 'mileage as of ' $testdir/$1/$file) > /dev/null; then
+	    echo "$0: FAILED: $file from $1 differs from $2"
+	    status=1
+	fi
+    done
+}
+
+extra="$@"
+caches="-W $testdir/wptcache.pickle -L $testdir/listcache.pickle -S $testdir/updatestate.pickle"
+echo "$0: running with caches and update state"
+run first $caches
+echo "$0: adding a point to ny.i1.wpt and running with -e"
+sed -i '1i 0 http://www.openstreetmap.org/?lat=41.900000&lon=-76.000000' $hwy/hwy_data/NY/usai/ny.i1.wpt
+run errorcheck $caches -e
+echo "$0: running incrementally"
+run second $caches
+echo "$0: running without caches"
+run nocache
+compare second nocache
+echo "$0: adding NY7 to tester.list and running incrementally"
+echo "NY NY7 1 4" >> $users/tester.list
+run third $caches
+echo "$0: running without caches"
+run nocache2
+compare third nocache2
+echo "$0: running incrementally with nothing changed"
+run fourth $caches
+compare fourth nocache2
+# with nothing changed, nothing should have been computed again
+if ! grep -q " 0 segments to check" $testdir/fourth/siteupdate.log || grep -q " 0 unchanged subgraphs" $testdir/fourth/siteupdate.log; then
+    echo "$0: FAILED: run with nothing changed did not use the update state"
+    status=1
+fi
+if [ "$status" == "0" ]; then
+    echo "$0: passed"
+fi
+exit $status
@@ -17,12 +17,18 @@ else
 fi
 logdir=logs
 statdir=stats
+procflag=
 date
 # process command line args
 for arg in "$@"; do
     if [ "$arg" == "--nopull" ]; then
 	pull=0
     fi
+    if [ "$arg" == "--parallel" ]; then
+	# -p to siteupdate.py reads .wpt files and does the data
+	# checks in worker processes, one per CPU
+	procflag="-p `nproc`"
+    fi
     shift
 done
 if [ "$pull" == "1" ]; then
@@ -35,6 +41,6 @@ echo "$0: creating directories"
 mkdir -p $logdir/users $statdir
 
 echo "$0: launching siteupdate.py"
-PYTHONIOENCODING='utf-8' ./siteupdate.py -e -l $logdir -c $statdir | tee $logdir/siteupdate.log 2>&1 || exit 1
+PYTHONIOENCODING='utf-8' ./siteupdate.py -e $procflag -l $logdir -c $statdir | tee $logdir/siteupdate.log 2>&1 || exit 1
 date
 echo "$0: complete"
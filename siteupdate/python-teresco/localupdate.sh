@@ -16,6 +16,8 @@ statdir=stats
 graphdir=graphdata
 nmpmdir=nmp_merged
 graphflag=
+incremental=0
+cacheflags=
 date
 # process command line args
 for arg in "$@"; do
@@ -29,6 +31,12 @@ for arg in "$@"; do
     if [ "$arg" == "--nopull" ]; then
 	pull=0
     fi
+    if [ "$arg" == "--incremental" ]; then
+	# keep .wpt and list caches and the update state between runs,
+	# and compute again only what files changed since the commits
+	# the last run processed could affect
+	incremental=1
+    fi
     shift
 done
 if [ "$pull" == "1" ]; then
@@ -36,6 +44,28 @@ if [ "$pull" == "1" ]; then
       (cd $tmbase/HighwayData; git pull)
       (cd $tmbase/UserData; git pull)
 fi
+if [ "$incremental" == "1" ]; then
+    # cachecommits.txt holds the HighwayData and UserData commits
+    # processed by the last run; siteupdate.py checks them against
+    # those recorded in its caches, and checks every file in full
+    # for a cache written from any others
+    hwyhead=`cd $tmbase/HighwayData; git rev-parse HEAD`
+    userhead=`cd $tmbase/UserData; git rev-parse HEAD`
+    echo "$0: listing files changed since last run in changedfiles.txt"
+    echo "#to $hwyhead $userhead" > changedfiles.txt
+    if [ -f cachecommits.txt ]; then
+	read hwycached usercached < cachecommits.txt
+	if (cd $tmbase/HighwayData; git diff --name-only $hwycached HEAD) >> changedfiles.txt && (cd $tmbase/UserData; git diff --name-only $usercached HEAD) >> changedfiles.txt; then
+	    echo "#from $hwycached $usercached" >> changedfiles.txt
+	fi
+    fi
+    cacheflags="-W wptcache.pickle -L listcache.pickle -I changedfiles.txt -S updatestate.pickle"
+    if [ "$graphflag" != "-k" ]; then
+	# graphs written by the last run that are still the same are
+	# copied from where they were installed
+	cacheflags="$cacheflags -G $tmwebbase/$graphdir"
+    fi
+fi
 
 echo "$0: creating directories"
 mkdir -p $datestr/$logdir/users $datestr/$statdir $datestr/$nmpmdir $datestr/$logdir/nmpbyregion
@@ -57,7 +87,10 @@ echo "**********************************************************************"
 echo "show processlist;" | mysql --defaults-group-suffix=travmap -u travmap
 
 echo "$0: launching siteupdate.py"
-PYTHONIOENCODING='utf-8' ./siteupdate.py -d TravelMapping-$datestr $graphflag -l $datestr/$logdir -c $datestr/$statdir -g $datestr/$graphdir -n $datestr/$nmpmdir | tee $datestr/$logdir/siteupdate.log 2>&1 || exit 1
+PYTHONIOENCODING='utf-8' ./siteupdate.py -d TravelMapping-$datestr $graphflag $cacheflags -l $datestr/$logdir -c $datestr/$statdir -g $datestr/$graphdir -n $datestr/$nmpmdir | tee $datestr/$logdir/siteupdate.log 2>&1 || exit 1
+if [ "$incremental" == "1" ]; then
+    echo "$hwyhead $userhead" > cachecommits.txt
+fi
 date
 
 if [ -x ../../nmpfilter/nmpbyregion ]; then
@@ -11,13 +11,30 @@ This module defines classes to represent the contents of a
 """
 
 import argparse
+import array
+import atexit
+import bisect
 import datetime
+import gc
+import hashlib
+import json
 import math
+import multiprocessing
 import os
+import pickle
 import re
+import shutil
 import sys
 import time
 import threading
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import resource
+except ImportError:
+    resource = None
 
 class ElapsedTime:
     """To get a nicely-formatted elapsed time string for printing"""
@@ -28,6 +45,64 @@ class ElapsedTime:
     def et(self):
         return "[{0:.1f}] ".format(time.time()-self.start_time)
 
+class PhaseProfile:
+    """Record the wall clock time, CPU time, peak memory use and
+    number of objects tracked by the garbage collector for each major
+    phase of processing, to be written as a JSON report"""
+
+    def __init__(self, et):
+        self.et = et
+        self.phases = []
+        self.current = None
+
+    def phase(self, name):
+        """end the current phase, if any, and start one called name"""
+        self.end()
+        times = os.times()
+        self.current = (name, time.time(), times.user + times.system,
+                        times.children_user + times.children_system)
+
+    def end(self):
+        """end the current phase, if any, and record its measurements"""
+        if self.current is None:
+            return
+        (name, start, cpu, children_cpu) = self.current
+        times = os.times()
+        now = time.time()
+        entry = dict()
+        entry['phase'] = name
+        entry['start'] = round(start - self.et.start_time, 3)
+        entry['wall'] = round(now - start, 3)
+        entry['cpu'] = round(times.user + times.system - cpu, 3)
+        # worker processes are only counted once they have finished
+        entry['children_cpu'] = round(times.children_user + times.children_system - children_cpu, 3)
+        entry['peak_rss_kb'] = self.peak_rss_kb()
+        entry['gc_objects'] = len(gc.get_objects())
+        self.phases.append(entry)
+        self.current = None
+
+    def peak_rss_kb(self):
+        """return the peak resident set size of this process so far in
+        KB, or None if it is not available on this platform"""
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # reported in bytes rather than KB on macOS
+        if sys.platform == 'darwin':
+            peak //= 1024
+        return peak
+
+    def write(self, filename):
+        """end the current phase, if any, and write the report"""
+        self.end()
+        report = dict()
+        report['started'] = datetime.datetime.fromtimestamp(self.et.start_time).isoformat()
+        report['total_wall'] = round(time.time() - self.et.start_time, 3)
+        report['phases'] = self.phases
+        with open(filename, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+            file.write('\n')
+
 class ErrorList:
     """Track a list of potentially fatal errors"""
 
@@ -41,6 +116,256 @@ class ErrorList:
         self.error_list.append(e)
         self.lock.release()
 
+class WptFileTracker:
+    """Track the .wpt files found under a hwy_data directory that
+    have not yet been processed, in the order they were found"""
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        # a dict with no values serves as a set that keeps its order
+        self.unprocessed = dict()
+        # walk the directory tree in the same order os.walk would,
+        # each directory's files, then each subdirectory in turn
+        dirs = [path]
+        while len(dirs) > 0:
+            dir = dirs.pop()
+            subdirs = []
+            try:
+                with os.scandir(dir) as entries:
+                    for entry in entries:
+                        try:
+                            is_dir = entry.is_dir()
+                        except OSError:
+                            is_dir = False
+                        if is_dir:
+                            if not entry.is_symlink():
+                                subdirs.append(dir+"/"+entry.name)
+                        elif entry.name.endswith('.wpt') and '_boundaries' not in dir:
+                            self.unprocessed[dir+"/"+entry.name] = None
+            except OSError:
+                continue
+            subdirs.reverse()
+            dirs.extend(subdirs)
+
+    def __len__(self):
+        return len(self.unprocessed)
+
+    def processed(self, path):
+        """mark the file at path, if one was found, as processed"""
+        self.lock.acquire()
+        self.unprocessed.pop(path, None)
+        self.lock.release()
+
+    def unprocessed_files(self):
+        """return a list of the files not yet processed"""
+        return list(self.unprocessed)
+
+class FileCache:
+    """Keep results computed from the contents of files between runs,
+    so files that have not changed need not be processed again.
+    Entries are keyed by file path and are only used when the SHA-1
+    hash of the file's contents matches the one recorded when the
+    result was stored, and only if the cache was written with the
+    same signature, which should identify the format of the results
+    and anything other than the file contents they depend on.
+    The cache also records commits, identifying the versions of the
+    data repositories it is written from, if known, so files changed
+    since then can later be listed rather than found by hashing.
+    """
+
+    def __init__(self,filename,signature,commits=None):
+        self.filename = filename
+        self.signature = signature
+        self.commits = commits
+        self.lock = threading.Lock()
+        self.entries = dict()
+        # commits the cache file was written from, if known
+        self.cached_commits = None
+        try:
+            file = open(filename, 'rb')
+        except OSError:
+            pass
+        else:
+            try:
+                contents = pickle.load(file)
+                if contents[0] == self.signature:
+                    (signature, self.cached_commits, self.entries) = contents
+            except Exception as e:
+                print("WARNING: ignoring unreadable cache " + filename + ": " + str(e))
+            file.close()
+        # entries for this run, which are all that will be saved
+        self.new_entries = dict()
+        # hashes of files looked up, for store
+        self.digests = dict()
+
+    def lookup(self,path,unchanged=False):
+        """return the result cached for the file at path, or None if
+        it is not cached or has changed.  If unchanged is True, the
+        file is known not to have changed since the cache was written,
+        so a cached result is used without reading the file"""
+        entry = self.entries.get(path)
+        if entry is not None and unchanged:
+            digest = entry[0]
+        else:
+            try:
+                file = open(path, 'rb')
+            except OSError:
+                return None
+            digest = hashlib.sha1(file.read()).digest()
+            file.close()
+        self.lock.acquire()
+        self.digests[path] = digest
+        if entry is not None and entry[0] == digest:
+            self.new_entries[path] = entry
+            self.lock.release()
+            return entry[1]
+        self.lock.release()
+        return None
+
+    def changed_since(self,commits,changed_files):
+        """return changed_files, the set of files changed since the
+        data repositories were at commits, if the cache was written
+        from those commits, so any other file is known not to have
+        changed, or None if that cannot be known"""
+        if commits is None or commits != self.cached_commits:
+            return None
+        return changed_files
+
+    def digest(self,path):
+        """return the SHA-1 hash of the contents of the file at path
+        found when it was looked up, or None if it was not"""
+        return self.digests.get(path)
+
+    def store(self,path,result):
+        """cache the result computed from the file at path, which
+        must have been looked up first"""
+        self.lock.acquire()
+        if path in self.digests:
+            self.new_entries[path] = (self.digests[path], result)
+        self.lock.release()
+
+    def save(self):
+        """write the cache file, replacing any previous one"""
+        try:
+            file = open(self.filename + ".tmp", 'wb')
+            pickle.dump((self.signature, self.commits, self.new_entries), file, pickle.HIGHEST_PROTOCOL)
+            file.close()
+            os.replace(self.filename + ".tmp", self.filename)
+        except OSError as e:
+            print("WARNING: could not write cache " + self.filename + ": " + str(e))
+
+class UpdateState:
+    """Keep the results of the passes of a site update that follow
+    the reading of .wpt and list files between runs: concurrencies,
+    concurrency augments, traveler stats and log entries, datachecks
+    and graphs, so a later run computes again only those that the
+    .wpt, .csv and .list files changed since could affect.  Results
+    are kept in named sections, each a dict keyed by route root,
+    traveler name, system name or graph file, and are only used if
+    the state was written with the same signature, which should
+    identify the format of the sections and the highway systems,
+    regions, countries and continents, which any result could depend
+    on.
+    """
+
+    def __init__(self,filename,signature):
+        self.filename = filename
+        self.signature = signature
+        # sections written by the last run, or None if there is no
+        # usable state
+        self.previous = None
+        try:
+            file = open(filename, 'rb')
+        except OSError:
+            pass
+        else:
+            try:
+                contents = pickle.load(file)
+                if contents[0] == self.signature:
+                    self.previous = contents[1]
+            except Exception as e:
+                print("WARNING: ignoring unreadable state " + filename + ": " + str(e))
+            file.close()
+        # sections for this run, which are all that will be saved
+        self.current = dict()
+
+    def section(self,name):
+        """return the named section written by the last run, or an
+        empty dict if there is none"""
+        if self.previous is None:
+            return dict()
+        return self.previous.get(name, dict())
+
+    def save(self):
+        """write the state file, replacing any previous one"""
+        try:
+            file = open(self.filename + ".tmp", 'wb')
+            pickle.dump((self.signature, self.current), file, pickle.HIGHEST_PROTOCOL)
+            file.close()
+            os.replace(self.filename + ".tmp", self.filename)
+        except OSError as e:
+            print("WARNING: could not write state " + self.filename + ": " + str(e))
+
+class LogFile:
+    """Collect the text of a log file in memory and write it in large
+    batches with writelines, through a large I/O buffer, rather than
+    with a separate small write for each line or part of a line"""
+
+    # lines collected before they are passed to the file
+    batch_size = 8192
+    # size of the file object's own buffer
+    buffer_size = 1 << 20
+
+    def __init__(self, filename, encoding=None):
+        self.file = open(filename, 'w', encoding=encoding, buffering=LogFile.buffer_size)
+        self.batch = []
+
+    def write(self, text):
+        """add text, which should include any newline needed"""
+        self.batch.append(text)
+        if len(self.batch) >= LogFile.batch_size:
+            self.flush()
+
+    def write_lines(self, lines):
+        """add each of the given lines followed by a newline"""
+        for line in lines:
+            self.batch.append(line + "\n")
+            if len(self.batch) >= LogFile.batch_size:
+                self.flush()
+
+    def write_header(self):
+        """add the creation time line that starts most log files"""
+        self.write("Log file created at: " + str(datetime.datetime.now()) + "\n")
+
+    def flush(self):
+        self.file.writelines(self.batch)
+        self.batch = []
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+class WriteLogThread(threading.Thread):
+    """Write the logs of TravelerLists taken from a list shared with
+    other threads, until it is empty"""
+
+    def __init__(self, id, t_list, lock, path):
+        threading.Thread.__init__(self)
+        self.id = id
+        self.t_list = t_list
+        self.lock = lock
+        self.path = path
+
+    def run(self):
+        while True:
+            self.lock.acquire(True)
+            if len(self.t_list) == 0:
+                self.lock.release()
+                break
+            t = self.t_list.pop()
+            self.lock.release()
+            t.write_log(self.path)
+
 class WaypointQuadtree:
     """This class defines a recursive quadtree structure to store
     Waypoint objects for efficient geometric searching.
@@ -242,6 +567,519 @@ class WaypointQuadtree:
         else:
             self.points.sort(key=lambda waypoint: waypoint.route.root + "@" + waypoint.label)
 
+class ArrayWaypointQuadtree:
+    """This class stores Waypoint objects in a quadtree with the same
+    interface as WaypointQuadtree, but with node midpoints, children
+    and waypoint ranges in flat arrays rather than an object per node,
+    and all waypoints in a single list, ordered so that those of each
+    terminal quadrant are together.  The nodes are refined all at
+    once, without recursion, the next time the tree is searched after
+    waypoints are inserted, so it is fastest to insert all waypoints
+    before doing any searching.
+    """
+    def __init__(self,min_lat,min_lng,max_lat,max_lng):
+        """initialize an empty quadtree on a given space"""
+        self.min_lat = min_lat
+        self.min_lng = min_lng
+        self.max_lat = max_lat
+        self.max_lng = max_lng
+        # all waypoints, in order by terminal quadrant once built,
+        # followed by any inserted since
+        self.waypoints = []
+        self.refine()
+
+    def refine(self):
+        """refine the tree into sub-quadrants until no terminal quadrant
+        has more than 50 unique locations, rebuilding the node arrays
+        for all waypoints inserted so far"""
+        # node i has its midpoint at mid_lat[i],mid_lng[i], and is
+        # either refined, with its NW, NE, SW and SE children at
+        # child[i] to child[i]+3, or a terminal quadrant, with child[i]
+        # -1, holding waypoints[start[i]] to waypoints[end[i]-1]
+        waypoints = self.waypoints
+        self.node_mid_lat = array.array('d', [(self.min_lat + self.max_lat) / 2])
+        self.node_mid_lng = array.array('d', [(self.min_lng + self.max_lng) / 2])
+        self.node_child = array.array('i', [-1])
+        self.node_start = array.array('i', [0])
+        self.node_end = array.array('i', [len(waypoints)])
+        self.node_unique_locations = array.array('i', [0])
+        stack = [(0, self.min_lat, self.min_lng, self.max_lat, self.max_lng)]
+        while len(stack) > 0:
+            (n, min_lat, min_lng, max_lat, max_lng) = stack.pop()
+            start = self.node_start[n]
+            end = self.node_end[n]
+            # count unique locations only as far as needed to know
+            # whether this quadrant must be refined
+            locations = set()
+            for i in range(start, end):
+                locations.add((waypoints[i].lat, waypoints[i].lng))
+                if len(locations) > 50:  # 50 unique points max per quadtree node
+                    break
+            self.node_unique_locations[n] = len(locations)
+            if len(locations) <= 50:
+                continue
+            # refine into 4 sub-quadrants, keeping waypoints in the
+            # same order within each
+            mid_lat = self.node_mid_lat[n]
+            mid_lng = self.node_mid_lng[n]
+            nw = []
+            ne = []
+            sw = []
+            se = []
+            for w in waypoints[start:end]:
+                if w.lat < mid_lat:
+                    if w.lng < mid_lng:
+                        sw.append(w)
+                    else:
+                        se.append(w)
+                else:
+                    if w.lng < mid_lng:
+                        nw.append(w)
+                    else:
+                        ne.append(w)
+            self.node_child[n] = len(self.node_child)
+            for (points, bounds) in ((nw, (mid_lat,min_lng,max_lat,mid_lng)),
+                                     (ne, (mid_lat,mid_lng,max_lat,max_lng)),
+                                     (sw, (min_lat,min_lng,mid_lat,mid_lng)),
+                                     (se, (min_lat,mid_lng,mid_lat,max_lng))):
+                waypoints[start:start + len(points)] = points
+                stack.append((len(self.node_child),) + bounds)
+                self.node_mid_lat.append((bounds[0] + bounds[2]) / 2)
+                self.node_mid_lng.append((bounds[1] + bounds[3]) / 2)
+                self.node_child.append(-1)
+                self.node_start.append(start)
+                self.node_end.append(start + len(points))
+                self.node_unique_locations.append(0)
+                start += len(points)
+        self.needs_refine = False
+
+    def insert(self,w):
+        """insert Waypoint w into this quadtree"""
+        self.waypoints.append(w)
+        self.needs_refine = True
+
+    def waypoint_at_same_point(self,w):
+        """find an existing waypoint at the same coordinates as w"""
+        if self.needs_refine:
+            self.refine()
+        n = 0
+        while self.node_child[n] >= 0:
+            if w.lat < self.node_mid_lat[n]:
+                if w.lng < self.node_mid_lng[n]:
+                    n = self.node_child[n] + 2
+                else:
+                    n = self.node_child[n] + 3
+            else:
+                if w.lng < self.node_mid_lng[n]:
+                    n = self.node_child[n]
+                else:
+                    n = self.node_child[n] + 1
+        for p in self.waypoints[self.node_start[n]:self.node_end[n]]:
+            if p.same_coords(w):
+                return p
+        return None
+
+    def near_miss_waypoints(self, w, tolerance):
+        """compute and return a list of existing waypoints which are
+        within the near-miss tolerance (in degrees lat, lng) of w"""
+        if self.needs_refine:
+            self.refine()
+        near_miss_points = []
+        lat = w.lat
+        lng = w.lng
+        stack = [0]
+        while len(stack) > 0:
+            n = stack.pop()
+            child = self.node_child[n]
+            if child < 0:
+                # terminal quadrant, search for NMPs within it
+                for p in self.waypoints[self.node_start[n]:self.node_end[n]]:
+                    if (p.lat != lat or p.lng != lng) and \
+                       abs(p.lat - lat) < tolerance and \
+                       abs(p.lng - lng) < tolerance and \
+                       p is not w:
+                        near_miss_points.append(p)
+            else:
+                # determine which child quadrants we need to search,
+                # pushed so they are searched in NW, NE, SW, SE order
+                look_north = (lat + tolerance) >= self.node_mid_lat[n]
+                look_south = (lat - tolerance) <= self.node_mid_lat[n]
+                look_east = (lng + tolerance) >= self.node_mid_lng[n]
+                look_west = (lng - tolerance) <= self.node_mid_lng[n]
+                if look_south and look_east:
+                    stack.append(child + 3)
+                if look_south and look_west:
+                    stack.append(child + 2)
+                if look_north and look_east:
+                    stack.append(child + 1)
+                if look_north and look_west:
+                    stack.append(child)
+
+        return near_miss_points
+
+    def __str__(self):
+        s = "ArrayWaypointQuadtree at (" + str(self.min_lat) + "," + \
+            str(self.min_lng) + ") to (" + str(self.max_lat) + "," + \
+            str(self.max_lng) + ")"
+        return s + " contains " + str(len(self.waypoints)) + " waypoints"
+
+    def size(self):
+        """return the number of Waypoints in the tree"""
+        return len(self.waypoints)
+
+    def terminal_nodes(self):
+        """return a list of all terminal quadrants, in the order
+        WaypointQuadtree.point_list visits them: NE, NW, SE, SW"""
+        if self.needs_refine:
+            self.refine()
+        terminal_nodes = []
+        stack = [0]
+        while len(stack) > 0:
+            n = stack.pop()
+            child = self.node_child[n]
+            if child < 0:
+                terminal_nodes.append(n)
+            else:
+                stack.extend((child + 2, child + 3, child, child + 1))
+        return terminal_nodes
+
+    def point_list(self):
+        """return a list of all points in the quadtree"""
+        all_points = []
+        for n in self.terminal_nodes():
+            all_points.extend(self.waypoints[self.node_start[n]:self.node_end[n]])
+        return all_points
+
+    def is_valid(self):
+        """make sure the quadtree is valid"""
+        if self.needs_refine:
+            self.refine()
+        for n in range(len(self.node_child)):
+            child = self.node_child[n]
+            if child >= 0:
+                # refined, so its children should cover its waypoints
+                if child + 4 > len(self.node_child):
+                    print("ERROR: ArrayWaypointQuadtree.is_valid refined quadrant has missing children.")
+                    return False
+                if self.node_start[child] != self.node_start[n] or \
+                   self.node_end[child + 3] != self.node_end[n]:
+                    print("ERROR: ArrayWaypointQuadtree.is_valid refined quadrant children do not cover its waypoints.")
+                    return False
+            elif self.node_unique_locations[n] > 50:
+                print("ERROR: ArrayWaypointQuadtree.is_valid terminal quadrant has too many unique points (" + str(self.node_unique_locations[n]) + ")")
+                return False
+        return True
+
+    def max_colocated(self):
+        """return the maximum number of waypoints colocated at any one location"""
+        max_col = 1
+        for p in self.waypoints:
+            if max_col < p.num_colocated():
+                max_col = p.num_colocated()
+        print("Largest colocate count = " + str(max_col))
+        return max_col
+
+    def total_nodes(self):
+        if self.needs_refine:
+            self.refine()
+        return len(self.node_child)
+
+    def sort(self):
+        for n in self.terminal_nodes():
+            start = self.node_start[n]
+            end = self.node_end[n]
+            self.waypoints[start:end] = sorted(self.waypoints[start:end], key=lambda waypoint: waypoint.route.root + "@" + waypoint.label)
+
+def find_near_miss_points(waypoints, tolerance):
+    """find all pairs of Waypoints in the list that are within the
+    near-miss tolerance (in degrees lat, lng) of each other but not at
+    the same coordinates, and add each to the other's near_miss_points
+    list.  This finds the same pairs as searching the quadtree with
+    near_miss_waypoints once per waypoint, but in a few batched numpy
+    operations over arrays of all coordinates."""
+    num_points = len(waypoints)
+    if num_points == 0:
+        return
+    lat = numpy.fromiter((w.lat for w in waypoints), numpy.float64, num_points)
+    lng = numpy.fromiter((w.lng for w in waypoints), numpy.float64, num_points)
+
+    # group waypoints by location, as colocated points are never near
+    # misses of each other, and all points at one location are near
+    # misses of the same other points
+    order = numpy.lexsort((lng, lat))
+    lat = lat[order]
+    lng = lng[order]
+    new_location = numpy.empty(num_points, bool)
+    new_location[0] = True
+    new_location[1:] = (lat[1:] != lat[:-1]) | (lng[1:] != lng[:-1])
+    location_start = numpy.flatnonzero(new_location)
+    location_end = numpy.append(location_start[1:], num_points)
+    lat = lat[new_location]
+    lng = lng[new_location]
+    num_locations = len(lat)
+
+    # put locations in grid cells twice the tolerance in size, so any
+    # near miss is in the same cell or one of the 8 adjacent cells,
+    # and a little floating point error in finding cells can't break
+    # that.  cell coordinates are clipped so out of bounds lat/lng
+    # values can't overflow, which can only merge cells, and make
+    # candidate pairs, which are checked exactly below anyway
+    cell_size = 2 * tolerance
+    cell_lat = numpy.clip(numpy.floor(lat / cell_size), -2**30, 2**30).astype(numpy.int64)
+    cell_lng = numpy.clip(numpy.floor(lng / cell_size), -2**30, 2**30).astype(numpy.int64)
+    cell = cell_lat * 2**32 + cell_lng
+    by_cell = numpy.argsort(cell, kind='stable')
+    cell = cell[by_cell]
+
+    # join each location to all locations in its own cell after it in
+    # sorted order, and to all in 4 of its neighboring cells, which
+    # considers each pair of locations in adjacent cells once
+    positions = numpy.arange(num_locations)
+    pairs1 = []
+    pairs2 = []
+    for (cell_offset, same_cell) in ((0, True), (1, False), (2**32-1, False),
+                                     (2**32, False), (2**32+1, False)):
+        if same_cell:
+            first = positions + 1
+        else:
+            first = numpy.searchsorted(cell, cell + cell_offset, 'left')
+        last = numpy.searchsorted(cell, cell + cell_offset, 'right')
+        counts = numpy.maximum(last - first, 0)
+        total = counts.sum()
+        if total == 0:
+            continue
+        loc1 = numpy.repeat(positions, counts)
+        loc2 = numpy.repeat(first - numpy.cumsum(counts) + counts, counts) + numpy.arange(total)
+        loc1 = by_cell[loc1]
+        loc2 = by_cell[loc2]
+        near = (numpy.abs(lat[loc1] - lat[loc2]) < tolerance) & \
+               (numpy.abs(lng[loc1] - lng[loc2]) < tolerance)
+        pairs1.append(loc1[near])
+        pairs2.append(loc2[near])
+    if len(pairs1) == 0:
+        return
+
+    # finally, record the near misses between all waypoints at each
+    # pair of locations found
+    order = order.tolist()
+    location_start = location_start.tolist()
+    location_end = location_end.tolist()
+    for (loc1, loc2) in zip(numpy.concatenate(pairs1).tolist(),
+                            numpy.concatenate(pairs2).tolist()):
+        for i in order[location_start[loc1]:location_end[loc1]]:
+            w = waypoints[i]
+            for j in order[location_start[loc2]:location_end[loc2]]:
+                other_w = waypoints[j]
+                if w.near_miss_points is None:
+                    w.near_miss_points = [ other_w ]
+                else:
+                    w.near_miss_points.append(other_w)
+                if other_w.near_miss_points is None:
+                    other_w.near_miss_points = [ w ]
+                else:
+                    other_w.near_miss_points.append(w)
+
+def compute_mileage_stats(highway_systems, traveler_lists, concurrency_groups,
+                          overall_mileage_by_region,
+                          active_preview_mileage_by_region,
+                          active_only_mileage_by_region,
+                          clinched_mask=-1):
+    """compute the same mileage totals as the stats loop in the main
+    program: each route's mileage, overall, active+preview and active
+    only mileage by region in the given dicts, each system's
+    mileage_by_region, and each traveler's clinched_route_mileage,
+    active_preview_mileage_by_region, active_only_mileage_by_region
+    and system_region_mileages, using numpy arrays with an entry per
+    segment, and per traveler who has clinched a segment.  Only the
+    travelers whose bits are set in clinched_mask are credited.
+
+    Each total is a grouped sum with numpy.bincount, which adds in
+    array order, the same order the stats loop adds each segment's
+    mileage, so the totals are exactly the same.  dict entries are
+    created in the order the loop would first create them."""
+    # first, columns with an entry for each segment: its length (see
+    # HighwaySegment.compute_lengths), route, system, region, and the
+    # number of concurrent segments counted when dividing its length
+    # between them for each kind of total.  Segments are numbered in
+    # route order, so the route column repeats each route's number
+    # once per segment, and the system and region columns follow
+    routes = []
+    regions = []
+    region_ids = dict()
+    route_sizes = array.array('l')
+    route_systems = array.array('l')
+    route_regions = array.array('l')
+    pair_segments = array.array('l')
+    pair_travelers = array.array('l')
+    for h_num in range(len(highway_systems)):
+        h = highway_systems[h_num]
+        print(".",end="",flush=True)
+        for r in h.route_list:
+            routes.append(r)
+            if r.region not in region_ids:
+                region_ids[r.region] = len(regions)
+                regions.append(r.region)
+            route_sizes.append(len(r.segment_list))
+            route_systems.append(h_num)
+            route_regions.append(region_ids[r.region])
+            for s in r.segment_list:
+                if s.clinched_by & clinched_mask:
+                    for t in s.clinched_by_travelers(traveler_lists, clinched_mask):
+                        pair_segments.append(s.segment_id)
+                        pair_travelers.append(t.traveler_num)
+    route_col = numpy.repeat(numpy.arange(len(routes), dtype=numpy.int64),
+                             numpy.asarray(route_sizes, numpy.int64))
+    system_col = numpy.asarray(route_systems, numpy.int64)[route_col]
+    region_col = numpy.asarray(route_regions, numpy.int64)[route_col]
+
+    # a segment not concurrent with any other counts only itself, and
+    # one that is counts the segments of its concurrent list, of the
+    # same system, or active or preview, or active only, which are
+    # the same for all the segments that share the list
+    counted_segments = array.array('l')
+    system_counts = array.array('l')
+    active_only_counts = array.array('l')
+    active_preview_counts = array.array('l')
+    overall_counts = array.array('l')
+    for group in concurrency_groups:
+        active_only_count = 0
+        active_preview_count = 0
+        counts_by_system = dict()
+        for other in group:
+            if other.route.system.active_or_preview():
+                active_preview_count += 1
+                if other.route.system.active():
+                    active_only_count += 1
+            counts_by_system[other.route.system] = counts_by_system.get(other.route.system, 0) + 1
+        for s in group:
+            if s.concurrent is group:
+                # the segment itself is one of those in the list
+                counted_segments.append(s.segment_id)
+                system_counts.append(counts_by_system[s.route.system])
+                active_only_counts.append(active_only_count + (not s.route.system.active()))
+                active_preview_counts.append(active_preview_count + (not s.route.system.active_or_preview()))
+                overall_counts.append(len(group))
+    lengths = numpy.frombuffer(HighwaySegment.lengths, numpy.float64)
+    num_regions = len(regions)
+    num_systems = len(highway_systems)
+    active = numpy.array([h.active() for h in highway_systems], bool)[system_col]
+    active_or_preview = numpy.array([h.active_or_preview() for h in highway_systems], bool)[system_col]
+    counted_segments = numpy.asarray(counted_segments, numpy.int64)
+    divisors = []
+    for counts in (system_counts, active_only_counts, active_preview_counts, overall_counts):
+        divisor = numpy.ones(len(lengths))
+        divisor[counted_segments] = numpy.asarray(counts, numpy.float64)
+        divisors.append(divisor)
+    system_mileage = lengths / divisors[0]
+    active_only_mileage = lengths / divisors[1]
+    active_preview_mileage = lengths / divisors[2]
+    overall_mileage = lengths / divisors[3]
+
+    def grouped_sums(keys, weights):
+        """return the distinct keys in the order they first occur, and
+        the sum of the weights for each, added in array order"""
+        (unique_keys, first, inverse) = numpy.unique(keys, return_index=True, return_inverse=True)
+        sums = numpy.bincount(inverse.ravel(), weights, len(unique_keys))
+        order = numpy.argsort(first, kind='stable')
+        return (unique_keys[order].tolist(), sums[order].tolist())
+
+    # route mileages include every segment
+    route_mileages = numpy.bincount(route_col, lengths, len(routes)).tolist()
+    for r_num in range(len(routes)):
+        routes[r_num].mileage += route_mileages[r_num]
+
+    # overall, active+preview and active only totals by region
+    for (totals, mask, mileage) in \
+        ((overall_mileage_by_region, None, overall_mileage),
+         (active_preview_mileage_by_region, active_or_preview, active_preview_mileage),
+         (active_only_mileage_by_region, active, active_only_mileage)):
+        if mask is None:
+            (keys, sums) = grouped_sums(region_col, mileage)
+        else:
+            (keys, sums) = grouped_sums(region_col[mask], mileage[mask])
+        for (region_num, miles) in zip(keys, sums):
+            totals[regions[region_num]] = miles
+
+    # system totals by region
+    (keys, sums) = grouped_sums(system_col * num_regions + region_col, system_mileage)
+    for (key, miles) in zip(keys, sums):
+        highway_systems[key // num_regions].mileage_by_region[regions[key % num_regions]] = miles
+
+    if len(pair_segments) == 0:
+        return
+    # now the same for travelers, with an entry for each traveler
+    # who has clinched each segment
+    pair_segments = numpy.asarray(pair_segments, numpy.int64)
+    pair_travelers = numpy.asarray(pair_travelers, numpy.int64)
+    pair_active = active[pair_segments]
+    pair_active_or_preview = active_or_preview[pair_segments]
+    pair_regions = region_col[pair_segments]
+
+    (keys, sums) = grouped_sums(pair_travelers * len(routes) + route_col[pair_segments],
+                                lengths[pair_segments])
+    for (key, miles) in zip(keys, sums):
+        traveler_lists[key // len(routes)].clinched_route_mileage[routes[key % len(routes)]] = miles
+
+    (keys, sums) = grouped_sums((pair_travelers * num_regions + pair_regions)[pair_active_or_preview],
+                                active_preview_mileage[pair_segments][pair_active_or_preview])
+    for (key, miles) in zip(keys, sums):
+        traveler_lists[key // num_regions].active_preview_mileage_by_region[regions[key % num_regions]] = miles
+
+    (keys, sums) = grouped_sums((pair_travelers * num_regions + pair_regions)[pair_active],
+                                active_only_mileage[pair_segments][pair_active])
+    for (key, miles) in zip(keys, sums):
+        traveler_lists[key // num_regions].active_only_mileage_by_region[regions[key % num_regions]] = miles
+
+    # each traveler's dict of systems must also be in the order the
+    # systems are first credited, which is the order of the first
+    # region credited in each
+    (keys, sums) = grouped_sums(((pair_travelers * num_systems + system_col[pair_segments]) * num_regions
+                                 + pair_regions)[pair_active_or_preview],
+                                system_mileage[pair_segments][pair_active_or_preview])
+    for (key, miles) in zip(keys, sums):
+        t = traveler_lists[key // (num_systems * num_regions)]
+        h = highway_systems[key // num_regions % num_systems]
+        if h.systemname not in t.system_region_mileages:
+            t.system_region_mileages[h.systemname] = dict()
+        t.system_region_mileages[h.systemname][regions[key % num_regions]] = miles
+
+def angle_datacheck_candidates(point_list):
+    """return the indices of the interior points of a route's point
+    list that could be BAD_ANGLE or SHARP_ANGLE errors: those at the
+    same coordinates as a neighbor, and those whose turn angle, as
+    computed by Waypoint.angle but for all points at once with numpy,
+    is over 134 degrees, could not be computed, or joins a segment
+    too short for it to be accurate.  The angles of these are computed
+    again one at a time, so errors and their info are reported exactly
+    as when every point is checked."""
+    num_points = len(point_list)
+    if num_points < 3:
+        return []
+    lat = numpy.fromiter((w.lat for w in point_list), numpy.float64, num_points)
+    lng = numpy.fromiter((w.lng for w in point_list), numpy.float64, num_points)
+    same_coords = (lat[:-2] == lat[1:-1]) & (lng[:-2] == lng[1:-1]) | \
+                  (lat[2:] == lat[1:-1]) & (lng[2:] == lng[1:-1])
+
+    # unit vectors of all points, and the vectors along each segment
+    rlat = numpy.radians(lat)
+    rlng = numpy.radians(lng)
+    x = numpy.cos(rlng)*numpy.cos(rlat)
+    y = numpy.sin(rlng)*numpy.cos(rlat)
+    z = numpy.sin(rlat)
+    dx = x[1:] - x[:-1]
+    dy = y[1:] - y[:-1]
+    dz = z[1:] - z[:-1]
+    lengths_squared = dx*dx + dy*dy + dz*dz
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        angles = numpy.degrees(numpy.arccos((dx[1:]*dx[:-1] + dy[1:]*dy[:-1] + dz[1:]*dz[:-1]) /
+                                            numpy.sqrt(lengths_squared[1:]*lengths_squared[:-1])))
+    # a margin of a degree allows for numpy's trig functions differing
+    # from math's in the last bits, and segments under 1e-9 Earth radii
+    # magnify those differences too much to rely on the margin
+    candidates = same_coords | ~(angles <= 134) | \
+                 (lengths_squared[1:] < 1e-18) | (lengths_squared[:-1] < 1e-18)
+    return (numpy.flatnonzero(candidates) + 1).tolist()
+
 class Waypoint:
     """This class encapsulates the information about a single waypoint
     from a .wpt file.
@@ -252,7 +1090,17 @@ class Waypoint:
 
     root is the unique identifier for the route in which this waypoint
     is defined
+
+    unique_name and point_num are set later, when building graphs and
+    writing the database
     """
+    __slots__ = ('route','label','is_hidden','alt_labels','lat','lng',
+                 'colocated','near_miss_points','unique_name','point_num')
+
+    # matches a well-formed OSM URL in one step, capturing the lat and
+    # lng strings the checks in __init__ would extract and accept
+    url_re = re.compile(r'[^=]*=(-?(?:[0-9]+\.?[0-9]*|\.[0-9]+))(?:&[^=]*)?=(-?(?:[0-9]+\.?[0-9]*|\.[0-9]+))(?:[&=].*)?')
+
     def __init__(self,line,route,datacheckerrors):
         """initialize object from a .wpt file line"""
         self.route = route
@@ -264,15 +1112,24 @@ class Waypoint:
             self.alt_labels = parts[1:-1]
         else:
             self.alt_labels = []
+        # also keep track of a list of colocated waypoints, if any
+        self.colocated = None
+        # and keep a list of "near-miss points", if any
+        self.near_miss_points = None
         # last has the URL, which needs more work to get lat/lng
+        # in the common case, it's well-formed and we're done
+        url_match = Waypoint.url_re.fullmatch(parts[-1])
+        if url_match is not None:
+            self.lat = float(url_match.group(1))
+            self.lng = float(url_match.group(2))
+            return
+        # otherwise, find out what's wrong with it
         url_parts = parts[-1].split('=')
         if len(url_parts) < 3:
             #print("\nWARNING: Malformed URL in " + route.root + ", line: " + line, end="", flush=True)
             datacheckerrors.append(DatacheckEntry(route,[self.label],'MALFORMED_URL', parts[-1]))
             self.lat = 0
             self.lng = 0
-            self.colocated = None
-            self.near_miss_points = None
             return
         lat_string = url_parts[1].split("&")[0] # chop off "&lon"
         lng_string = url_parts[2].split("&")[0] # chop off possible "&zoom"
@@ -333,10 +1190,25 @@ class Waypoint:
 
         self.lat = float(lat_string)
         self.lng = float(lng_string)
-        # also keep track of a list of colocated waypoints, if any
-        self.colocated = None
-        # and keep a list of "near-miss points", if any
-        self.near_miss_points = None
+
+    @staticmethod
+    def from_record(record,route):
+        """create a Waypoint in route from a compact (label, alt_labels,
+        lat, lng) tuple as returned by record(), without reparsing the
+        .wpt file line"""
+        w = Waypoint.__new__(Waypoint)
+        w.route = route
+        (w.label, w.alt_labels, w.lat, w.lng) = record
+        w.is_hidden = w.label.startswith('+')
+        w.colocated = None
+        w.near_miss_points = None
+        return w
+
+    def record(self):
+        """return a compact tuple of the information read from this
+        waypoint's .wpt file line, small enough to pass efficiently
+        between processes"""
+        return (self.label, self.alt_labels, self.lat, self.lng)
 
     def __str__(self):
         ans = self.route.root + " " + self.label
@@ -656,33 +1528,74 @@ class Waypoint:
 
 class HighwaySegment:
     """This class represents one highway segment: the connection between two
-    Waypoints connected by one or more routes"""
+    Waypoints connected by one or more routes
+
+    clinched_by is a bitmap of the travelers who have clinched the
+    segment, where bit n is set for the TravelerList with traveler_num n
+
+    segment_id is None until all routes are read, when the lengths of
+    all segments are computed, see compute_lengths
+
+    visited is set later, when building graphs"""
+    __slots__ = ('waypoint1','waypoint2','route','concurrent','clinched_by',
+                 'segment_name','visited','segment_id')
+
+    # lengths of all segments in miles, indexed by segment_id
+    lengths = array.array('d')
 
     def __init__(self,w1,w2,route):
         self.waypoint1 = w1
         self.waypoint2 = w2
         self.route = route
         self.concurrent = None
-        self.clinched_by = []
+        self.clinched_by = 0
         self.segment_name = None
+        self.segment_id = None
 
     def __str__(self):
         return self.route.readable_name() + " " + self.waypoint1.label + " " + self.waypoint2.label
 
     def add_clinched_by(self,traveler):
-        if traveler not in self.clinched_by:
-            self.clinched_by.append(traveler)
+        bit = 1 << traveler.traveler_num
+        if not self.clinched_by & bit:
+            self.clinched_by |= bit
             return True
         else:
             return False
 
+    def clinched_by_travelers(self,traveler_lists,mask=-1):
+        """return a list of the travelers who have clinched this segment,
+        from the list of all TravelerList objects, in traveler_num order,
+        only those whose bits are set in mask if given"""
+        travelers = []
+        bits = self.clinched_by & mask
+        while bits:
+            lowest = bits & -bits
+            travelers.append(traveler_lists[lowest.bit_length()-1])
+            bits ^= lowest
+        return travelers
+
     def csv_line(self,id):
         """return csv line to insert into a table"""
         return "'" + str(id) + "','" + str(self.waypoint1.point_num) + "','" + str(self.waypoint2.point_num) + "','" + self.route.root + "'"
 
     def length(self):
         """return segment length in miles"""
-        return self.waypoint1.distance_to(self.waypoint2)
+        if self.segment_id is None:
+            return self.waypoint1.distance_to(self.waypoint2)
+        return HighwaySegment.lengths[self.segment_id]
+
+    @staticmethod
+    def compute_lengths(highway_systems):
+        """number all segments of all routes in order, and compute and
+        store their lengths, so each is computed only once"""
+        lengths = array.array('d')
+        for h in highway_systems:
+            for r in h.route_list:
+                for s in r.segment_list:
+                    s.segment_id = len(lengths)
+                    lengths.append(s.waypoint1.distance_to(s.waypoint2))
+        HighwaySegment.lengths = lengths
 
     def set_segment_name(self):
         """compute and set a segment name based on names of all
@@ -735,6 +1648,11 @@ class Route:
     AltRouteNames: (optional) comma-separated list former or other
     alternate route names that might appear in user list files.
     """
+    __slots__ = ('system','region','route','banner','abbrev','city','root',
+                 'alt_route_names','point_list','labels_in_use',
+                 'unused_alt_labels','segment_list','mileage','rootOrder',
+                 'label_index','point_index')
+
     def __init__(self,line,system,el):
         """initialize object from a .csv file line, but do not
         yet read in waypoint file"""
@@ -758,13 +1676,19 @@ class Route:
         self.segment_list = []
         self.mileage = 0.0
         self.rootOrder = -1  # order within connected route
+        self.label_index = None
+        self.point_index = None
 
     def __str__(self):
         """printable version of the object"""
         return self.root + " (" + str(len(self.point_list)) + " total points)"
 
-    def read_wpt(self,all_waypoints,all_waypoints_lock,datacheckerrors,el,path="../../../HighwayData/hwy_data"):
-        """read data into the Route's waypoint list from a .wpt file"""
+    def read_wpt(self,datacheckerrors,el,path="../../../HighwayData/hwy_data"):
+        """read data into the Route's waypoint list from a .wpt file
+
+        waypoints are not added to the quadtree here, that and the
+        search for colocated and near-miss points are done once all
+        routes have been read"""
         #print("read_wpt on " + str(self))
         self.point_list = []
         try:
@@ -783,55 +1707,90 @@ class Route:
                     if w.is_valid() == False:
                         w = previous_point
                         continue
-                    self.point_list.append(w)
-                    # populate unused alt labels
-                    for label in w.alt_labels:
-                        self.unused_alt_labels.add(label.upper().strip("+"))
-                    # look for colocated points
-                    all_waypoints_lock.acquire()
-                    other_w = all_waypoints.waypoint_at_same_point(w)
-                    if other_w is not None:
-                        # see if this is the first point colocated with other_w
-                        if other_w.colocated is None:
-                            other_w.colocated = [ other_w ]
-                        other_w.colocated.append(w)
-                        w.colocated = other_w.colocated
-
-                    # look for near-miss points (before we add this one in)
-                    #print("DEBUG: START search for nmps for waypoint " + str(w) + " in quadtree of size " + str(all_waypoints.size()))
-                    #if not all_waypoints.is_valid():
-                    #    sys.exit()
-                    nmps = all_waypoints.near_miss_waypoints(w, 0.0005)
-                    #print("DEBUG: for waypoint " + str(w) + " got " + str(len(nmps)) + " nmps: ", end="")
-                    #for dbg_w in nmps:
-                    #    print(str(dbg_w) + " ", end="")
-                    #print()
-                    if len(nmps) > 0:
-                        if w.near_miss_points is None:
-                            w.near_miss_points = nmps
-                        else:
-                            w.near_miss_points.extend(nmps)
-    
-                        for other_w in nmps:
-                            if other_w.near_miss_points is None:
-                                other_w.near_miss_points = [ w ]
-                            else:
-                                other_w.near_miss_points.append(w)
-    
-                    all_waypoints.insert(w)
-                    all_waypoints_lock.release()
-                    # add HighwaySegment, if not first point
-                    if previous_point is not None:
-                        self.segment_list.append(HighwaySegment(previous_point, w, self))
+                    self.append_waypoint(w)
+
+    def read_wpt_records(self,records):
+        """populate the Route's waypoint list from compact waypoint
+        records, such as those produced by a worker process that read
+        the .wpt file, see Waypoint.record"""
+        self.point_list = []
+        for record in records:
+            self.append_waypoint(Waypoint.from_record(record,self))
+
+    def append_waypoint(self,w):
+        """add w to the end of the Route's waypoint list, and add the
+        HighwaySegment that connects it to the previous point, if any"""
+        self.point_list.append(w)
+        self.label_index = None
+        self.point_index = None
+        # populate unused alt labels
+        for label in w.alt_labels:
+            self.unused_alt_labels.add(label.upper().strip("+"))
+        # add HighwaySegment, if not first point
+        if len(self.point_list) > 1:
+            self.segment_list.append(HighwaySegment(self.point_list[-2], w, self))
 
     def print_route(self):
         for point in self.point_list:
             print(str(point))
 
+    def find_label_matches(self,list_label_1,list_label_2):
+        """return a list of (index in point_list, matched label, is_alt)
+        for each waypoint label matching either of the labels from a
+        traveler list line, which must already be lowercase with any
+        leading or trailing "+" or "*" removed.  Labels are matched
+        ignoring case and leading or trailing "+" or "*", or "+" only
+        for alt labels, which are only considered for waypoints whose
+        label does not match.  Every matching alt label counts, so a
+        waypoint can match more than once.
+
+        Matches are found using an index of the labels, which is built
+        the first time it is needed"""
+        if self.label_index is None:
+            # map each normalized label to (index, alt position) for
+            # each occurrence, with alt position -1 for primary labels
+            self.label_index = dict()
+            for index in range(len(self.point_list)):
+                w = self.point_list[index]
+                label = w.label.lower().strip("+*")
+                if label in self.label_index:
+                    self.label_index[label].append((index, -1))
+                else:
+                    self.label_index[label] = [ (index, -1) ]
+                for alt_pos in range(len(w.alt_labels)):
+                    label = w.alt_labels[alt_pos].lower().strip("+")
+                    if label in self.label_index:
+                        self.label_index[label].append((index, alt_pos))
+                    else:
+                        self.label_index[label] = [ (index, alt_pos) ]
+        matches = []
+        for label in (list_label_1, list_label_2):
+            for (index, alt_pos) in self.label_index.get(label, ()):
+                matches.append((index, alt_pos, label))
+            if list_label_2 == list_label_1:
+                break
+        primary_matches = set(index for (index, alt_pos, label) in matches if alt_pos < 0)
+        matches.sort()
+        return [ (index, label.upper(), alt_pos >= 0) for (index, alt_pos, label) in matches
+                 if alt_pos < 0 or index not in primary_matches ]
+
     def find_segment_by_waypoints(self,w1,w2):
-        for s in self.segment_list:
-            if s.waypoint1 is w1 and s.waypoint2 is w2 or s.waypoint1 is w2 and s.waypoint2 is w1:
-                return s
+        """return the segment connecting waypoints w1 and w2 of this
+        route, in either order, or None if they are not adjacent"""
+        # build the index from each waypoint to its position in
+        # point_list on first use; segment i connects points i and i+1
+        if self.point_index is None:
+            self.point_index = dict()
+            for index in range(len(self.point_list)):
+                self.point_index[self.point_list[index]] = index
+        index1 = self.point_index.get(w1)
+        index2 = self.point_index.get(w2)
+        if index1 is None or index2 is None:
+            return None
+        if index2 == index1 + 1:
+            return self.segment_list[index1]
+        if index1 == index2 + 1:
+            return self.segment_list[index2]
         return None
 
     def csv_line(self):
@@ -855,13 +1814,6 @@ class Route:
         labels, where the abbrev field is often omitted"""
         return self.route + self.banner
 
-    def clinched_by_traveler(self,t):
-        miles = 0.0
-        for s in self.segment_list:
-            if t in s.clinched_by:
-                miles += s.length()
-        return miles
-
 class ConnectedRoute:
     """This class encapsulates a single 'connected route' as given
     by a single line of a _con.csv file
@@ -997,15 +1949,88 @@ class TravelerList:
     start_waypoint end_waypoint
     """
 
-    def __init__(self,travelername,route_hash,path="../../../UserData/list_files"):
+    def __init__(self,travelername,traveler_num,route_hash,path="../../../UserData/list_files",resolved=None):
+        """read and process the list file, or if it has already been
+        resolved, see resolve, apply the result
+
+        traveler_num must be this traveler's index in the list of all
+        TravelerList objects, see HighwaySegment.clinched_by"""
         self.list_entries = []
         self.clinched_segments = set()
         self.traveler_name = travelername[:-5]
+        self.traveler_num = traveler_num
+        if resolved is None:
+            resolved = TravelerList.resolve(travelername,route_hash,path)
+        (log_entries, list_entries, clinched, labels_used, roots) = resolved
+
+        self.log_entries = list(log_entries)
+        for (line, root, canonical_start, canonical_end) in list_entries:
+            self.list_entries.append(ClinchedSegmentEntry(line, root, \
+                                                          canonical_start, \
+                                                          canonical_end))
+        for (lookup, label, is_alt) in labels_used:
+            r = route_hash[lookup]
+            r.labels_in_use.add(label)
+            # if we have not yet used this alt label, remove it from the unused list
+            if is_alt and label in r.unused_alt_labels:
+                r.unused_alt_labels.remove(label)
+        # find the segments matched and store this traveler with the
+        # segments and the segments with the traveler (might not need
+        # both ultimately)
+        for (lookup, start, end) in clinched:
+            r = route_hash[lookup]
+            for wp_pos in range(start,end):
+                hs = r.segment_list[wp_pos] #r.get_segment(r.point_list[wp_pos], r.point_list[wp_pos+1])
+                hs.add_clinched_by(self)
+                if hs not in self.clinched_segments:
+                    self.clinched_segments.add(hs)
+
+        self.log_entries.append("Processed " + str(len(self.list_entries)) + \
+                                    " good lines marking " +str(len(self.clinched_segments)) + \
+                                    " segments traveled.")
+        # additional setup for later stats processing
+        # a place to track this user's total mileage per region,
+        # but only active+preview and active only (since devel
+        # systems are not clinchable)
+        self.active_preview_mileage_by_region = dict()
+        self.active_only_mileage_by_region = dict()
+        # a place for this user's total mileage per system, again by region
+        # this will be a dictionary of dictionaries, keys of the top level
+        # are system names (e.g., 'usai') and values are dictionaries whose
+        # keys are region names and values are total mileage in that
+        # system in that region
+        self.system_region_mileages = dict()
+        # and a place for this user's clinched mileage on each route,
+        # keys are Route objects, only present for routes with any
+        # clinched segments
+        self.clinched_route_mileage = dict()
+
+    @staticmethod
+    def resolve(travelername,route_hash,path="../../../UserData/list_files"):
+        """read the list file and match its lines to routes and
+        waypoints, without changing any Route or HighwaySegment, and
+        return the result as a tuple of:
+
+        log_entries: log lines for the traveler so far
+        list_entries: (line, root, canonical_start, canonical_end) for
+        each good line
+        clinched: (route_hash key, start, end) for each good line, where
+        the segments from point_list[start] to point_list[end] are
+        clinched
+        labels_used: (route_hash key, label, is_alt) for each waypoint
+        label matched, to be added to the route's labels_in_use and,
+        for alt labels, removed from its unused_alt_labels
+        roots: sorted roots of all routes whose waypoints were searched
+        """
         with open(path+"/"+travelername,"rt", encoding='UTF-8') as file:
             lines = file.readlines()
         file.close()
 
-        self.log_entries = []
+        log_entries = []
+        list_entries = []
+        clinched = []
+        labels_used = []
+        roots = set()
 
         for line in lines:
             line = line.strip().rstrip('\x00')
@@ -1016,90 +2041,54 @@ class TravelerList:
             if len(fields) != 4:
                 # OK if 5th field exists and starts with #
                 if len(fields) < 5 or not fields[4].startswith("#"):
-                    self.log_entries.append("Incorrect format line: " + line)
+                    log_entries.append("Incorrect format line: " + line)
                     continue
 
             # find the root that matches in some system and when we do, match labels
             route_entry = fields[1].lower()
             lookup = fields[0].lower() + ' ' + route_entry
             if lookup not in route_hash:
-                self.log_entries.append("Unknown region/highway combo in line: " + line)
+                log_entries.append("Unknown region/highway combo in line: " + line)
             else:
                 r = route_hash[lookup]
                 for a in r.alt_route_names:
                     if route_entry == a.lower():
-                        self.log_entries.append("Note: deprecated route name " + fields[1] + " -> canonical name " + r.list_entry_name() + " in line " + line)
+                        log_entries.append("Note: deprecated route name " + fields[1] + " -> canonical name " + r.list_entry_name() + " in line " + line)
                         break
 
                 if r.system.devel():
-                    self.log_entries.append("Ignoring line matching highway in system in development: " + line)
+                    log_entries.append("Ignoring line matching highway in system in development: " + line)
                     continue
+                roots.add(r.root)
                 # r is a route match, r.root is our root, and we need to find
                 # canonical waypoint labels, ignoring case and leading
                 # "+" or "*" when matching
                 canonical_waypoints = []
                 canonical_waypoint_indices = []
-                checking_index = 0;
-                for w in r.point_list:
-                    lower_label = w.label.lower().strip("+*")
-                    list_label_1 = fields[2].lower().strip("+*")
-                    list_label_2 = fields[3].lower().strip("+*")
-                    if list_label_1 == lower_label or list_label_2 == lower_label:
-                        canonical_waypoints.append(w)
-                        canonical_waypoint_indices.append(checking_index)
-                        r.labels_in_use.add(lower_label.upper())
-                    else:
-                        for alt in w.alt_labels:
-                            lower_label = alt.lower().strip("+")
-                            if list_label_1 == lower_label or list_label_2 == lower_label:
-                                canonical_waypoints.append(w)
-                                canonical_waypoint_indices.append(checking_index)
-                                r.labels_in_use.add(lower_label.upper())
-                                # if we have not yet used this alt label, remove it from the unused list
-                                if lower_label.upper() in r.unused_alt_labels:
-                                    r.unused_alt_labels.remove(lower_label.upper())
-                                            
-                    checking_index += 1
+                list_label_1 = fields[2].lower().strip("+*")
+                list_label_2 = fields[3].lower().strip("+*")
+                for (index, label, is_alt) in r.find_label_matches(list_label_1, list_label_2):
+                    canonical_waypoints.append(r.point_list[index])
+                    canonical_waypoint_indices.append(index)
+                    labels_used.append((lookup, label, is_alt))
                 if len(canonical_waypoints) != 2:
-                    self.log_entries.append("Waypoint label(s) not found in line: " + line)
+                    log_entries.append("Waypoint label(s) not found in line: " + line)
                 else:
-                    self.list_entries.append(ClinchedSegmentEntry(line, r.root, \
-                                                                  canonical_waypoints[0].label, \
-                                                                  canonical_waypoints[1].label))
-                    # find the segments we just matched and store this traveler with the
-                    # segments and the segments with the traveler (might not need both
-                    # ultimately)
+                    list_entries.append((line, r.root, \
+                                         canonical_waypoints[0].label, \
+                                         canonical_waypoints[1].label))
                     #start = r.point_list.index(canonical_waypoints[0])
                     #end = r.point_list.index(canonical_waypoints[1])
                     start = canonical_waypoint_indices[0]
                     end = canonical_waypoint_indices[1]
-                    for wp_pos in range(start,end):
-                        hs = r.segment_list[wp_pos] #r.get_segment(r.point_list[wp_pos], r.point_list[wp_pos+1])
-                        hs.add_clinched_by(self)
-                        if hs not in self.clinched_segments:
-                            self.clinched_segments.add(hs)
+                    clinched.append((lookup, start, end))
 
-        self.log_entries.append("Processed " + str(len(self.list_entries)) + \
-                                    " good lines marking " +str(len(self.clinched_segments)) + \
-                                    " segments traveled.")
-        # additional setup for later stats processing
-        # a place to track this user's total mileage per region,
-        # but only active+preview and active only (since devel
-        # systems are not clinchable)
-        self.active_preview_mileage_by_region = dict()
-        self.active_only_mileage_by_region = dict()
-        # a place for this user's total mileage per system, again by region
-        # this will be a dictionary of dictionaries, keys of the top level
-        # are system names (e.g., 'usai') and values are dictionaries whose
-        # keys are region names and values are total mileage in that
-        # system in that region
-        self.system_region_mileages = dict()
+        return (log_entries, list_entries, clinched, labels_used, sorted(roots))
 
     def write_log(self,path="."):
-        logfile = open(path+"/"+self.traveler_name+".log","wt",encoding='UTF-8')
-        logfile.write("Log file created at: " + str(datetime.datetime.now()) + "\n")
-        for line in self.log_entries:
-            logfile.write(line + "\n")
+        logfile = LogFile(path+"/"+self.traveler_name+".log",'UTF-8')
+        logfile.write_header()
+        logfile.write_lines(self.log_entries)
         logfile.close()
 
 class ClinchedSegmentEntry:
@@ -1183,6 +2172,63 @@ class DatacheckEntry:
         entry += self.code+";"+self.info
         return entry
 
+class LabelFeatures:
+    """This class holds the properties of a waypoint label tested by
+    the label datachecks, each found once and shared by all of the
+    checks in label_datacheck_rules
+
+    pattern is the code of the error named by the match of the label
+    against LabelFeatures.patterns_re, or None if it does not match
+    """
+    __slots__ = ('label','underscores','first_underscore','slashes',
+                 'first_slash','parens_balanced','valid_chars','pattern')
+
+    valid_chars_re = re.compile(r'[a-zA-Z0-9()/\+\*_\-\.]+')
+    # labels that are datacheck errors by their form alone, as one
+    # regular expression with a group named by each error code
+    patterns_re = re.compile(r'(?P<BUS_WITH_I>I\-[0-9]*Bus)|'
+                             r'(?P<LABEL_LOOKS_HIDDEN>X[0-9][0-9][0-9][0-9][0-9][0-9])')
+
+    def __init__(self,label):
+        self.label = label
+        self.underscores = label.count('_')
+        self.first_underscore = label.find('_')
+        self.slashes = label.count('/')
+        self.first_slash = label.find('/')
+        self.parens_balanced = label.count('(') == label.count(')')
+        self.valid_chars = LabelFeatures.valid_chars_re.fullmatch(label) is not None
+        match = LabelFeatures.patterns_re.fullmatch(label)
+        if match is None:
+            self.pattern = None
+        else:
+            self.pattern = match.lastgroup
+
+# The datachecks of the label of each visible waypoint that depend only
+# on the label: each is an error code and a function of the label's
+# LabelFeatures returning True if the label has that error.  A new
+# check is added here, along with any new property it needs in
+# LabelFeatures, rather than as another pass over the label.
+label_datacheck_rules = [
+    # too many underscores
+    ('LABEL_UNDERSCORES', lambda f: f.underscores > 1),
+    # too many characters after underscore
+    ('LONG_UNDERSCORE', lambda f: f.first_underscore >= 0 and
+                                  f.first_underscore < len(f.label) - 5),
+    # too many slashes
+    ('LABEL_SLASHES', lambda f: f.slashes > 1),
+    # parenthesis balance
+    ('LABEL_PARENS', lambda f: not f.parens_balanced),
+    # invalid characters
+    ('LABEL_INVALID_CHAR', lambda f: not f.valid_chars),
+    # a slash after an underscore
+    ('NONTERMINAL_UNDERSCORE', lambda f: f.first_underscore >= 0 and
+                                         f.first_slash > f.first_underscore),
+    # I-xx with Bus instead of BL or BS
+    ('BUS_WITH_I', lambda f: f.pattern == 'BUS_WITH_I'),
+    # looks like a hidden waypoint but isn't hidden
+    ('LABEL_LOOKS_HIDDEN', lambda f: f.pattern == 'LABEL_LOOKS_HIDDEN'),
+]
+
 class HighwayGraphVertexInfo:
     """This class encapsulates information needed for a highway graph
     vertex.
@@ -1660,6 +2706,10 @@ class HighwayGraph:
         print("Edge compressed graph has " + str(self.num_visible_vertices()) +
               " vertices, " + str(self.collapsed_edge_count()) + " edges.")
 
+        # subgraphs written by an earlier run that can be used again,
+        # see reuse_subgraphs
+        self.subgraph_state = None
+
     def num_visible_vertices(self):
         count = 0
         for v in self.vertices.values():
@@ -1680,29 +2730,34 @@ class HighwayGraph:
                 edges += len(v.incident_collapsed_edges)
         return edges//2
 
+    def vertex_matches(self, vinfo, regions, systems, placeradius):
+        # return whether vinfo is in the graph restricted by region
+        # or system or placeradius area
+        if placeradius is not None and not placeradius.contains_vertex_info(vinfo):
+            return False
+        region_match = regions is None
+        if not region_match:
+            for r in regions:
+                if r in vinfo.regions:
+                    region_match = True
+                    break
+        if not region_match:
+            return False
+        system_match = systems is None
+        if not system_match:
+            for s in systems:
+                if s in vinfo.systems:
+                    system_match = True
+                    break
+        return system_match
+
     def matching_vertices(self, regions, systems, placeradius):
         # return a list of vertices from the graph, optionally
         # restricted by region or system or placeradius area
         vis = 0
         vertex_list = []
         for vinfo in self.vertices.values():
-            if placeradius is not None and not placeradius.contains_vertex_info(vinfo):
-                continue
-            region_match = regions is None
-            if not region_match:
-                for r in regions:
-                    if r in vinfo.regions:
-                        region_match = True
-                        break
-            if not region_match:
-                continue
-            system_match = systems is None
-            if not system_match:
-                for s in systems:
-                    if s in vinfo.systems:
-                        system_match = True
-                        break
-            if not system_match:
+            if not self.vertex_matches(vinfo, regions, systems, placeradius):
                 continue
             if not vinfo.is_hidden:
                 vis += 1
@@ -1710,9 +2765,11 @@ class HighwayGraph:
         return (vertex_list, vis)
 
     def matching_edges(self, mv, regions=None, systems=None, placeradius=None):
-        # return a set of edges from the graph, optionally
-        # restricted by region or system or placeradius area
-        edge_set = set()
+        # return the edges from the graph, optionally restricted by
+        # region or system or placeradius area, as the keys of a dict
+        # so they are in the order first found, and the same from run
+        # to run
+        edge_set = dict()
         for v in mv:
             for e in v.incident_edges:
                 if placeradius is None or placeradius.contains_edge(e):
@@ -1723,15 +2780,15 @@ class HighwayGraph:
                                 if s in systems:
                                     system_match = True
                         if system_match:
-                            edge_set.add(e)
+                            edge_set[e] = None
         return edge_set
 
     def matching_collapsed_edges(self, mv, regions=None, systems=None,
                                  placeradius=None):
-        # return a set of edges from the graph edges for the collapsed
+        # return the edges from the graph edges for the collapsed
         # edge format, optionally restricted by region or system or
-        # placeradius area
-        edge_set = set()
+        # placeradius area, as the keys of a dict as above
+        edge_set = dict()
         for v in mv:
             if v.is_hidden:
                 continue
@@ -1744,9 +2801,79 @@ class HighwayGraph:
                                 if s in systems:
                                     system_match = True
                         if system_match:
-                            edge_set.add(e)
+                            edge_set[e] = None
         return edge_set
 
+    def reuse_subgraphs(self, previous, current, previous_path=None):
+        # have write_subgraphs_tmg use the files of any subgraph
+        # written by an earlier run, as recorded in the dict previous,
+        # if it has exactly the same vertices and edges, and record
+        # those written or used in the dict current.  The files are
+        # looked for where they were written, or in previous_path if
+        # given, for files moved there since.  To find out, the
+        # vertices are numbered in order, with a digest of everything
+        # about each that is written to a subgraph file: its name,
+        # coordinates and visibility, and its incident edges and
+        # collapsed edges, along with the numbers of those in each
+        # region and system, and of all sorted by latitude
+        self.subgraph_state = (previous, current, previous_path)
+        self.reused_subgraph_count = 0
+        self.vertex_list = list(self.vertices.values())
+        self.vertex_digests = []
+        self.region_vertex_nums = dict()
+        self.system_vertex_nums = dict()
+        for num in range(len(self.vertex_list)):
+            v = self.vertex_list[num]
+            for region in v.regions:
+                if region not in self.region_vertex_nums:
+                    self.region_vertex_nums[region] = []
+                self.region_vertex_nums[region].append(num)
+            for h in v.systems:
+                if h not in self.system_vertex_nums:
+                    self.system_vertex_nums[h] = []
+                self.system_vertex_nums[h].append(num)
+            edges = [(e.vertex1.unique_name, e.vertex2.unique_name, e.region,
+                      [(name, h.systemname) for (name, h) in e.route_names_and_systems])
+                     for e in v.incident_edges]
+            collapsed_edges = [(e.vertex1.unique_name, e.vertex2.unique_name, e.region,
+                                [(name, h.systemname) for (name, h) in e.route_names_and_systems],
+                                [(w.lat, w.lng) for w in e.intermediate_points])
+                               for e in v.incident_collapsed_edges]
+            self.vertex_digests.append(hashlib.sha1(repr((v.unique_name, v.lat, v.lng, v.is_hidden,
+                                                          edges, collapsed_edges)).encode('utf-8')).digest())
+        self.vertex_nums_by_lat = sorted(range(len(self.vertex_list)), key=lambda num: self.vertex_list[num].lat)
+        self.sorted_lats = [self.vertex_list[num].lat for num in self.vertex_nums_by_lat]
+
+    def subgraph_fingerprint(self, descr, category, regions, systems, placeradius):
+        # return a digest of the contents of the files of the subgraph
+        # restricted by region or system or placeradius area: its
+        # description and the digests of its vertices, in order, which
+        # include all of the edges between them.  Only the vertices in
+        # the regions or systems are checked, or, for an area, those
+        # within its radius in latitude alone, as a degree of latitude
+        # is over 69 miles everywhere
+        if regions is not None:
+            candidates = set()
+            for region in regions:
+                candidates.update(self.region_vertex_nums.get(region, ()))
+        elif systems is not None:
+            candidates = set()
+            for h in systems:
+                candidates.update(self.system_vertex_nums.get(h, ()))
+        elif placeradius is not None:
+            first = bisect.bisect_left(self.sorted_lats, placeradius.lat - placeradius.r / 69)
+            last = bisect.bisect_right(self.sorted_lats, placeradius.lat + placeradius.r / 69)
+            candidates = self.vertex_nums_by_lat[first:last]
+        else:
+            candidates = range(len(self.vertex_list))
+        spec = (descr, category, regions, None if systems is None else [h.systemname for h in systems],
+                None if placeradius is None else (placeradius.lat, placeradius.lng, placeradius.r))
+        fingerprint = hashlib.sha1(repr(spec).encode('utf-8'))
+        for num in sorted(candidates):
+            if self.vertex_matches(self.vertex_list[num], regions, systems, placeradius):
+                fingerprint.update(self.vertex_digests[num])
+        return fingerprint.digest()
+
     # write the entire set of highway data a format very similar to
     # the original .gra format.  The first line is a header specifying
     # the format and version number, the second line specifying the
@@ -1827,12 +2954,60 @@ class HighwayGraph:
         tmgfile.close()
         return (self.num_visible_vertices(), self.collapsed_edge_count())
 
+    def reused_subgraph(self, graph_list, path, root, fingerprint):
+        # if the files of a subgraph written by an earlier run are
+        # unchanged since, and it has the same fingerprint (see
+        # subgraph_fingerprint), use them, copied to path if written
+        # elsewhere, and return True
+        (previous, current, previous_path) = self.subgraph_state
+        saved = previous.get(root)
+        if saved is None:
+            return False
+        (saved_fingerprint, saved_path, file_stats, entries) = saved
+        if saved_fingerprint != fingerprint:
+            return False
+        if previous_path is not None:
+            saved_path = os.path.abspath(previous_path) + "/"
+        try:
+            for (filename, size, mtime) in file_stats:
+                stat = os.stat(saved_path + filename)
+                if stat.st_size != size or stat.st_mtime_ns != mtime:
+                    return False
+            for (filename, size, mtime) in file_stats:
+                if os.path.abspath(path + filename) != saved_path + filename:
+                    shutil.copyfile(saved_path + filename, path + filename)
+        except OSError:
+            return False
+        for entry in entries:
+            print('(' + str(entry[2]) + ',' + str(entry[3]) + ") ", end="", flush=True)
+            graph_list.append(GraphListEntry(*entry))
+        self.record_subgraph(path, root, fingerprint, graph_list[-2:])
+        self.reused_subgraph_count += 1
+        return True
+
+    def record_subgraph(self, path, root, fingerprint, entries):
+        # record the files of a subgraph in the path given, with the
+        # GraphListEntry objects for them, so a later run can use them
+        (previous, current, previous_path) = self.subgraph_state
+        saved_path = os.path.abspath(path) + "/"
+        file_stats = []
+        for e in entries:
+            stat = os.stat(saved_path + e.filename)
+            file_stats.append((e.filename, stat.st_size, stat.st_mtime_ns))
+        current[root] = (fingerprint, saved_path, file_stats,
+                         [(e.filename, e.descr, e.vertices, e.edges, e.format, e.category) for e in entries])
+
     # write a subset of the data,
     # in both simple and collapsed formats,
     # restricted by regions in the list if given,
     # by system in the list if given,
     # or to within a given area if placeradius is given
     def write_subgraphs_tmg(self, graph_list, path, root, descr, category, regions, systems, placeradius):
+        fingerprint = None
+        if self.subgraph_state is not None:
+            fingerprint = self.subgraph_fingerprint(descr, category, regions, systems, placeradius)
+            if self.reused_subgraph(graph_list, path, root, fingerprint):
+                return
         visible = 0
         simplefile = open(path+root+"-simple.tmg","w",encoding='utf-8')
         collapfile = open(path+root+".tmg","w",encoding='utf-8')
@@ -1869,6 +3044,8 @@ class HighwayGraph:
 
         graph_list.append(GraphListEntry(root+"-simple.tmg", descr, len(mv), len(mse), "simple", category))
         graph_list.append(GraphListEntry(root   +    ".tmg", descr, visible, len(mce), "collapsed", category))
+        if fingerprint is not None:
+            self.record_subgraph(path, root, fingerprint, graph_list[-2:])
 
 def format_clinched_mi(clinched,total):
     """return a nicely-formatted string for a given number of miles
@@ -1899,6 +3076,9 @@ class GraphListEntry:
 # start a timer for including elapsed time reports in messages
 et = ElapsedTime()
 
+# and a profile of the time and memory taken by each phase
+profile = PhaseProfile(et)
+
 # create a ErrorList
 el = ErrorList()
 
@@ -1920,18 +3100,65 @@ parser.add_argument("-k", "--skipgraphs", action="store_true", help="Turn off ge
 parser.add_argument("-n", "--nmpmergepath", default="", help="Path to write data with NMPs merged (generated only if specified)")
 parser.add_argument("-U", "--userlist", default=None, nargs="+", help="For Development: list of users to use in dataset")
 parser.add_argument("-t", "--numthreads", default="4", help="Number of threads to use for concurrent tasks")
+parser.add_argument("-p", "--numprocesses", default="0", help="Number of worker processes to use for reading .wpt files and traveler list files and for data checks, or 0 to read .wpt files with threads and do the rest one at a time")
+parser.add_argument("-q", "--arrayquadtree", action="store_true", help="Store waypoints in an array-backed quadtree rather than one object per quadtree node")
+parser.add_argument("-W", "--wptcachefile", default=None, help="File in which to cache parsed .wpt files between runs (not cached if not given)")
+parser.add_argument("-L", "--listcachefile", default=None, help="File in which to cache processed traveler list files between runs (not cached if not given; requires -W)")
+parser.add_argument("-I", "--changedfiles", default=None, help="To reuse the .wpt and list file caches without checking unchanged files: file listing the paths, relative to the HighwayData and UserData repositories (as from git diff --name-only), of files changed between the HighwayData and UserData commits given on a line '#from HWYCOMMIT USERCOMMIT' and those to be processed, given on a line '#to HWYCOMMIT USERCOMMIT'.  Caches written from the '#from' commits then use cached results for other files without checking the files, and any others are checked in full")
+parser.add_argument("-S", "--statefile", default=None, help="File in which to keep concurrencies, traveler stats and log entries, datachecks and graphs between runs, so that only those that .wpt, .csv and list files changed since could affect are computed again (not kept if not given; requires -W and -L)")
+parser.add_argument("-G", "--previousgraphpath", default=None, help="Path to which the graph files written by the run that wrote the update state file have been moved since, if they have (-S only)")
 parser.add_argument("-e", "--errorcheck", action="store_true", help="Run only the subset of the process needed to verify highway data changes")
 args = parser.parse_args()
+# cached list results are checked against the .wpt file hashes that
+# only the .wpt cache records
+if args.listcachefile is not None and args.wptcachefile is None:
+    parser.error("-L/--listcachefile requires -W/--wptcachefile")
+# and the update state is checked against both
+if args.statefile is not None and args.listcachefile is None:
+    parser.error("-S/--statefile requires -W/--wptcachefile and -L/--listcachefile")
 
 #
 # Get list of travelers in the system
 traveler_ids = args.userlist
 traveler_ids = os.listdir(args.userlistfilepath) if traveler_ids is None else (id + ".list" for id in traveler_ids)
 
+# files changed since the commits the caches were written from, if
+# known, and the commits of the data being processed, which are
+# recorded in the caches written by this run
+changed_files = None
+changed_from = None
+data_commits = None
+if args.changedfiles is not None:
+    changed_files = set()
+    with open(args.changedfiles, "rt", encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if line.startswith("#from "):
+                changed_from = tuple(line.split()[1:])
+            elif line.startswith("#to "):
+                data_commits = tuple(line.split()[1:])
+            elif len(line) > 0:
+                changed_files.add(line)
+
+# write the profile however the run ends, as it is most useful
+# when a run stops early with an error
+atexit.register(profile.write, args.logfilepath+'/siteupdate-profile.json')
+
 # number of threads to use
 num_threads = int(args.numthreads)
 
+# number of worker processes to use, 0 meaning threads are used instead
+num_processes = int(args.numprocesses)
+# worker processes inherit the data structures built before they
+# start by forking, so all of their pools come from this context
+process_context = None
+if num_processes > 0:
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        parser.error("-p/--numprocesses requires a platform that can fork processes; use -t/--numthreads instead")
+    process_context = multiprocessing.get_context('fork')
+
 # read region, country, continent descriptions
+profile.phase("read_csv_data")
 print(et.et() + "Reading region, country, and continent descriptions.")
 
 continents = []
@@ -2100,30 +3327,68 @@ else:
 # For tracking whether any .wpt files are in the directory tree
 # that do not have a .csv file entry that causes them to be
 # read into the data
+profile.phase("read_wpt")
 print(et.et() + "Finding all .wpt files. ",end="",flush=True)
-all_wpt_files = []
-for dir, sub, files in os.walk(args.highwaydatapath+"/hwy_data"):
-    for file in files:
-        if file.endswith('.wpt') and '_boundaries' not in dir:
-            all_wpt_files.append(dir+"/"+file)
+all_wpt_files = WptFileTracker(args.highwaydatapath+"/hwy_data")
 print(str(len(all_wpt_files)) + " files found.")
 
 # For finding colocated Waypoints and concurrent segments, we have
 # quadtree of all Waypoints in existence to find them efficiently
-all_waypoints = WaypointQuadtree(-90,-180,90,180)
-all_waypoints_lock = threading.Lock()
+if args.arrayquadtree:
+    all_waypoints = ArrayWaypointQuadtree(-90,-180,90,180)
+else:
+    all_waypoints = WaypointQuadtree(-90,-180,90,180)
+
+# With a .wpt cache file given, find which routes' .wpt files are
+# unchanged since they were cached, and can be populated from the
+# cache rather than parsed again.  Cached results are the waypoint records (see
+# Waypoint.record) and the (labels, code, info) of the datacheck
+# entries found while parsing; the version in the signature must be
+# increased whenever .wpt parsing changes
+cached_wpts = dict()
+if args.wptcachefile is None:
+    wpt_cache = None
+else:
+    print(et.et() + "Checking .wpt file cache " + args.wptcachefile + ". ",end="",flush=True)
+    wpt_cache = FileCache(args.wptcachefile, ('wpt', 2), data_commits)
+    wpt_changed_files = wpt_cache.changed_since(changed_from, changed_files)
+    for h in highway_systems:
+        for r in h.route_list:
+            wpt_file = "hwy_data"+"/"+r.region + "/" + r.system.systemname+"/"+r.root+".wpt"
+            cached = wpt_cache.lookup(args.highwaydatapath+"/"+wpt_file,
+                                      wpt_changed_files is not None and wpt_file not in wpt_changed_files)
+            if cached is not None:
+                cached_wpts[r] = cached
+    print(str(len(cached_wpts)) + " unchanged files found.")
 
 print(et.et() + "Reading waypoints for all routes.")
 # Next, read all of the .wpt files for each HighwaySystem
 def read_wpts_for_highway_system(h):
     print(h.systemname,end="",flush=True)
     for r in h.route_list:
-        # get full path to remove from all_wpt_files list
+        # get full path to mark as processed in all_wpt_files
         wpt_path = args.highwaydatapath+"/hwy_data"+"/"+r.region + "/" + r.system.systemname+"/"+r.root+".wpt"
-        if wpt_path in all_wpt_files:
-            all_wpt_files.remove(wpt_path)
-        r.read_wpt(all_waypoints,all_waypoints_lock,datacheckerrors,
-                   el,args.highwaydatapath+"/hwy_data")
+        all_wpt_files.processed(wpt_path)
+        if r in cached_wpts:
+            (records, route_datacheckerrors) = cached_wpts[r]
+            for (labels, code, info) in route_datacheckerrors:
+                datacheckerrors.append(DatacheckEntry(r,labels,code,info))
+            r.read_wpt_records(records)
+        elif wpt_cache is None:
+            r.read_wpt(datacheckerrors,el,args.highwaydatapath+"/hwy_data")
+        else:
+            route_datacheckerrors = []
+            route_el = ErrorList()
+            r.read_wpt(route_datacheckerrors,route_el,
+                       args.highwaydatapath+"/hwy_data")
+            datacheckerrors.extend(route_datacheckerrors)
+            if len(route_el.error_list) > 0:
+                el.lock.acquire()
+                el.error_list.extend(route_el.error_list)
+                el.lock.release()
+            else:
+                wpt_cache.store(wpt_path, ([w.record() for w in r.point_list],
+                                           [(d.labels, d.code, d.info) for d in route_datacheckerrors]))
         if len(r.point_list) < 2:
             el.add_error("Route contains fewer than 2 points: " + str(r))
         print(".", end="",flush=True)
@@ -2131,6 +3396,26 @@ def read_wpts_for_highway_system(h):
         #r.print_route()
     print("!", flush=True)
 
+# worker process version: waypoints are parsed into compact records to
+# be sent back to the main process, since Waypoint objects are linked
+# to the rest of the highway data and would be very costly to pickle;
+# routes populated from the cache are left to the main process
+def wpt_records_for_highway_system(h_num):
+    h = highway_systems[h_num]
+    records = []
+    for r in h.route_list:
+        if r in cached_wpts:
+            records.append(None)
+            continue
+        route_datacheckerrors = []
+        route_el = ErrorList()
+        r.read_wpt(route_datacheckerrors,route_el,
+                   args.highwaydatapath+"/hwy_data")
+        records.append(([w.record() for w in r.point_list],
+                        [(d.labels, d.code, d.info) for d in route_datacheckerrors],
+                        route_el.error_list))
+    return records
+
 # set up for threaded processing of highway systems
 class ReadWptThread(threading.Thread):
 
@@ -2155,41 +3440,177 @@ class ReadWptThread(threading.Thread):
                 
         #print("Exiting ReadWptThread " + str(self.id))
         
-hs_lock = threading.Lock()
-#print("Created lock: " + str(hs_lock))
-hs = highway_systems[:]
-hs.reverse()
-thread_list = []
-# create threads
-for i in range(num_threads):
-    thread_list.append(ReadWptThread(i, hs, hs_lock))
-
-# start threads
-for t in thread_list:
-    t.start()
-
-# wait for threads
-for t in thread_list:
-    t.join()
+if num_processes > 0:
+    # parse in worker processes, which inherit the highway data
+    # structures by forking, then merge the results in system order
+    pool = process_context.Pool(num_processes)
+    for (h, h_records) in zip(highway_systems,
+                              pool.imap(wpt_records_for_highway_system,
+                                        range(len(highway_systems)))):
+        print(h.systemname,end="",flush=True)
+        for (r, route_records) in zip(h.route_list, h_records):
+            wpt_path = args.highwaydatapath+"/hwy_data"+"/"+r.region + "/" + r.system.systemname+"/"+r.root+".wpt"
+            all_wpt_files.processed(wpt_path)
+            if route_records is None:
+                (records, route_datacheckerrors) = cached_wpts[r]
+                route_errors = []
+            else:
+                (records, route_datacheckerrors, route_errors) = route_records
+                if wpt_cache is not None and len(route_errors) == 0:
+                    wpt_cache.store(wpt_path, (records, route_datacheckerrors))
+            # errors were already reported by the worker process
+            el.error_list.extend(route_errors)
+            for (labels, code, info) in route_datacheckerrors:
+                datacheckerrors.append(DatacheckEntry(r,labels,code,info))
+            r.read_wpt_records(records)
+            if len(r.point_list) < 2:
+                el.add_error("Route contains fewer than 2 points: " + str(r))
+            print(".", end="",flush=True)
+        print("!", flush=True)
+    pool.close()
+    pool.join()
+else:
+    hs_lock = threading.Lock()
+    #print("Created lock: " + str(hs_lock))
+    hs = highway_systems[:]
+    hs.reverse()
+    thread_list = []
+    # create threads
+    for i in range(num_threads):
+        thread_list.append(ReadWptThread(i, hs, hs_lock))
+
+    # start threads
+    for t in thread_list:
+        t.start()
+
+    # wait for threads
+    for t in thread_list:
+        t.join()
 
 #for h in highway_systems:
 #    read_wpts_for_highway_system(h)
 
+# the hash of each route's .wpt file contents, which a cached list
+# result must have been resolved against to be used (see below).
+# With -e, lists are not processed, so the .wpt cache is left as it
+# was to stay in step with the list cache
+wpt_digests = dict()
+if wpt_cache is not None:
+    if args.errorcheck:
+        print(et.et() + "SKIPPING writing .wpt file cache " + args.wptcachefile + ".", flush=True)
+    else:
+        for h in highway_systems:
+            for r in h.route_list:
+                wpt_path = args.highwaydatapath+"/hwy_data"+"/"+r.region + "/" + r.system.systemname+"/"+r.root+".wpt"
+                wpt_digests[r.root] = wpt_cache.digest(wpt_path)
+        print(et.et() + "Writing .wpt file cache " + args.wptcachefile + ".", flush=True)
+        wpt_cache.save()
+    wpt_cache = None
+cached_wpts = None
+
+# With an update state file given, find the routes that have changed
+# since it was written: those whose .wpt file contents or .csv fields
+# differ, and all routes of any system whose routes were added,
+# removed or reordered, and those removed.  Everything else the
+# results kept in the state depend on is in its signature, so any
+# change to systems, regions, countries or continents means none are
+# used.  With -e, the state is left as it was, like the caches
+state = None
+incremental = False
+dirty_routes = set()
+removed_roots = set()
+route_by_root = dict()
+if args.statefile is not None:
+    if args.errorcheck:
+        print(et.et() + "SKIPPING update state file " + args.statefile + ".", flush=True)
+    else:
+        print(et.et() + "Reading update state file " + args.statefile + ". ",end="",flush=True)
+        state = UpdateState(args.statefile,
+                            ('state', 1, numpy is not None,
+                             [(h.systemname, h.country, h.fullname, h.color, h.tier, h.level) for h in highway_systems],
+                             all_regions, countries, continents))
+        incremental = state.previous is not None
+        previous_routes = state.section('routes')
+        previous_system_roots = state.section('system_roots')
+        state.current['routes'] = dict()
+        state.current['system_roots'] = dict()
+        for h in highway_systems:
+            system_roots = [r.root for r in h.route_list]
+            state.current['system_roots'][h.systemname] = system_roots
+            for r in h.route_list:
+                route_by_root[r.root] = r
+                route_entry = (wpt_digests[r.root], h.systemname, r.region, r.route, r.banner,
+                               r.abbrev, r.city, r.alt_route_names)
+                state.current['routes'][r.root] = route_entry
+                if previous_system_roots.get(h.systemname) != system_roots or \
+                   previous_routes.get(r.root) != route_entry:
+                    dirty_routes.add(r)
+        for root in previous_routes:
+            if root not in route_by_root:
+                removed_roots.add(root)
+        previous_routes = None
+        previous_system_roots = None
+        if incremental:
+            print(str(len(dirty_routes)) + " changed and " + str(len(removed_roots)) + " removed routes found.")
+        else:
+            print("No usable state found.")
+
+# with all routes read, build the quadtree and look for near-miss
+# points in a single pass, with no global lock to contend for
+profile.phase("near_miss_points")
+print(et.et() + "Building quadtree.", flush=True)
+all_waypoint_list = []
+for h in highway_systems:
+    for r in h.route_list:
+        for w in r.point_list:
+            all_waypoints.insert(w)
+            all_waypoint_list.append(w)
+print(et.et() + "Finding near-miss points.", flush=True)
+if numpy is None:
+    # with all waypoints in the quadtree, each search finds all of
+    # a waypoint's near-miss points at once
+    for w in all_waypoint_list:
+        nmps = all_waypoints.near_miss_waypoints(w, 0.0005)
+        if len(nmps) > 0:
+            w.near_miss_points = nmps
+else:
+    find_near_miss_points(all_waypoint_list, 0.0005)
+all_waypoint_list = None
+
+print(et.et() + "Computing segment lengths.", flush=True)
+HighwaySegment.compute_lengths(highway_systems)
+
+profile.phase("colocation")
 print(et.et() + "Sorting waypoints in Quadtree.")
 all_waypoints.sort()
 
-print(et.et() + "Sorting colocated point lists.")
-for w in all_waypoints.point_list():
-    if w.colocated is not None:
-        w.colocated.sort(key=lambda waypoint: waypoint.route.root + "@" + waypoint.label)
+# now that all routes are loaded, find colocated points in one pass,
+# grouping waypoints by their exact coordinates, rather than searching
+# the quadtree once per waypoint
+print(et.et() + "Finding and sorting colocated point lists.")
+waypoints_at = dict()
+for h in highway_systems:
+    for r in h.route_list:
+        for w in r.point_list:
+            latlng = (w.lat, w.lng)
+            if latlng in waypoints_at:
+                waypoints_at[latlng].append(w)
+            else:
+                waypoints_at[latlng] = [ w ]
+for colocated in waypoints_at.values():
+    if len(colocated) > 1:
+        colocated.sort(key=lambda waypoint: waypoint.route.root + "@" + waypoint.label)
+        for w in colocated:
+            w.colocated = colocated
+waypoints_at = None
 
+profile.phase("waypoint_logs")
 print(et.et() + "Finding unprocessed wpt files.", flush=True)
-unprocessedfile = open(args.logfilepath+'/unprocessedwpts.log','w',encoding='utf-8')
+unprocessedfile = LogFile(args.logfilepath+'/unprocessedwpts.log','utf-8')
 if len(all_wpt_files) > 0:
     print(str(len(all_wpt_files)) + " .wpt files in " + args.highwaydatapath +
           "/hwy_data not processed, see unprocessedwpts.log.")
-    for file in all_wpt_files:
-        unprocessedfile.write(file[file.find('hwy_data'):] + '\n')
+    unprocessedfile.write_lines(file[file.find('hwy_data'):] for file in all_wpt_files.unprocessed_files())
 else:
     print("All .wpt files in " + args.highwaydatapath +
           "/hwy_data processed.")
@@ -2208,8 +3629,8 @@ for line in nmpfpfilelines:
 nmpfpfile.close()
 
 nmploglines = []
-nmplog = open(args.logfilepath+'/nearmisspoints.log','w')
-nmpnmp = open(args.logfilepath+'/tm-master.nmp','w')
+nmplog = LogFile(args.logfilepath+'/nearmisspoints.log')
+nmpnmp = LogFile(args.logfilepath+'/tm-master.nmp')
 for w in all_waypoints.point_list():
     if w.near_miss_points is not None:
         nmpline = str(w) + " NMP "
@@ -2251,21 +3672,18 @@ for w in all_waypoints.point_list():
 
         # write actual lines to .nmp file, indicating FP and/or LI
         # for marked FPs or looks intentional items
-        for nmpnmpline in nmpnmplines:
-            nmpnmp.write(nmpnmpline + extra_field + "\n")
+        nmpnmp.write_lines(nmpnmpline + extra_field for nmpnmpline in nmpnmplines)
 nmpnmp.close()
 
 # sort and write actual lines to nearmisspoints.log
 nmploglines.sort()
-for n in nmploglines:
-    nmplog.write(n + '\n')
+nmplog.write_lines(nmploglines)
 nmploglines = None
 nmplog.close()
 
 # report any unmatched nmpfps.log entries
-nmpfpsunmatchedfile = open(args.logfilepath+'/nmpfpsunmatched.log','w')
-for line in nmpfplist:
-    nmpfpsunmatchedfile.write(line + '\n')
+nmpfpsunmatchedfile = LogFile(args.logfilepath+'/nmpfpsunmatched.log')
+nmpfpsunmatchedfile.write_lines(nmpfplist)
 nmpfpsunmatchedfile.close()
 
 # if requested, rewrite data with near-miss points merged in
@@ -2300,534 +3718,953 @@ if args.nmpmergepath != "" and not args.errorcheck:
         print(".", end="", flush=True)
     print()
 
-# Create hash table for faster lookup of routes by list file name
-print(et.et() + "Creating route hash table for list processing:",flush=True)
-route_hash = dict()
-for h in highway_systems:
-    for r in h.route_list:
-        route_hash[(r.region + ' ' + r.list_entry_name()).lower()] = r
-        for a in r.alt_route_names:
-            route_hash[(r.region + ' ' + a).lower()] = r
-
-# Create a list of TravelerList objects, one per person
-traveler_lists = []
-
-print(et.et() + "Processing traveler list files:",end="",flush=True)
-for t in traveler_ids:
-    if t.endswith('.list'):
+# traveler lists and the updates files are needed only for stats, logs
+# and the database, not for checking highway data
+if args.errorcheck:
+    print(et.et() + "SKIPPING traveler list processing.", flush=True)
+    traveler_lists = []
+    wpt_digests = None
+else:
+    # Create hash table for faster lookup of routes by list file name
+    profile.phase("traveler_lists")
+    print(et.et() + "Creating route hash table for list processing:",flush=True)
+    route_hash = dict()
+    for h in highway_systems:
+        for r in h.route_list:
+            route_hash[(r.region + ' ' + r.list_entry_name()).lower()] = r
+            for a in r.alt_route_names:
+                route_hash[(r.region + ' ' + a).lower()] = r
+
+    # Create a list of TravelerList objects, one per person
+    traveler_lists = []
+
+    # With a list cache file given, lists that are unchanged since they
+    # were cached can use their cached results (see
+    # TravelerList.resolve).  These are stored with the hashes of the
+    # .wpt files of the routes they refer to, and are only used if
+    # those files are also unchanged, whatever run last wrote the .wpt
+    # cache.  They also depend on the routes' names and systems, so
+    # those are part of the signature, along with a version that must
+    # be increased whenever list processing or the cached entries change
+    if args.listcachefile is None:
+        list_cache = None
+    else:
+        route_names = [(lookup, r.root, r.list_entry_name(), r.alt_route_names,
+                        r.system.devel()) for (lookup, r) in route_hash.items()]
+        list_cache = FileCache(args.listcachefile,
+                               ('list', 3, hashlib.sha1(repr(route_names).encode('utf-8')).digest()),
+                               data_commits)
+        list_changed_files = list_cache.changed_since(changed_from, changed_files)
+        route_names = None
+    cached_lists = 0
+
+    # list files are processed in order by traveler name, which is also
+    # the order of their traveler numbers
+    list_files = [t for t in traveler_ids if t.endswith('.list')]
+    list_files.sort(key=lambda t: t[:-5])
+
+    # find the cached results that can be used for each list file, if any
+    resolved_lists = []
+    for t in list_files:
+        resolved = None
+        if list_cache is not None:
+            cached = list_cache.lookup(args.userlistfilepath+"/"+t,
+                                       list_changed_files is not None and "list_files/"+t not in list_changed_files)
+            if cached is not None:
+                (resolved, route_digests) = cached
+                if route_digests != [wpt_digests.get(root) for root in resolved[4]]:
+                    resolved = None
+            if resolved is not None:
+                cached_lists += 1
+        resolved_lists.append(resolved)
+
+    # worker process version: the list files not cached are read and
+    # resolved in parallel, without modifying the highway data structures,
+    # which happens below in list file order, just as when resolved here
+    def resolve_traveler_list(t):
+        return TravelerList.resolve(t,route_hash,args.userlistfilepath)
+
+    # bits, as in HighwaySegment.clinched_by, of the travelers whose
+    # results must be computed again, rather than taken from the
+    # update state if one is given
+    dirty_travelers = -1
+    if state is not None:
+        previous_travelers = state.section('travelers')
+        state.current['travelers'] = dict()
+        dirty_travelers = 0
+
+    print(et.et() + "Processing traveler list files:",end="",flush=True)
+    if num_processes > 0:
+        unresolved = [i for i in range(len(list_files)) if resolved_lists[i] is None]
+        pool = process_context.Pool(num_processes)
+        for (i, resolved) in zip(unresolved,
+                                 pool.imap(resolve_traveler_list,
+                                           [list_files[i] for i in unresolved])):
+            resolved_lists[i] = resolved
+            if list_cache is not None:
+                list_cache.store(args.userlistfilepath+"/"+list_files[i],
+                                 (resolved, [wpt_digests.get(root) for root in resolved[4]]))
+        pool.close()
+        pool.join()
+        unresolved = None
+    for i in range(len(list_files)):
+        t = list_files[i]
         print(" " + t,end="",flush=True)
-        traveler_lists.append(TravelerList(t,route_hash,args.userlistfilepath))
-print(" processed " + str(len(traveler_lists)) + " traveler list files.")
-traveler_lists.sort(key=lambda TravelerList: TravelerList.traveler_name)
-
-# Read updates.csv file, just keep in the fields array for now since we're
-# just going to drop this into the DB later anyway
-updates = []
-print(et.et() + "Reading updates file.  ",end="",flush=True)
-with open(args.highwaydatapath+"/updates.csv", "rt", encoding='UTF-8') as file:
-    lines = file.readlines()
-file.close()
+        resolved = resolved_lists[i]
+        if resolved is None:
+            resolved = resolve_traveler_list(t)
+            if list_cache is not None:
+                list_cache.store(args.userlistfilepath+"/"+t,
+                                 (resolved, [wpt_digests.get(root) for root in resolved[4]]))
+        traveler_lists.append(TravelerList(t,i,route_hash,args.userlistfilepath,resolved))
+        if state is not None:
+            # the list's results could have changed since the update
+            # state was written if it is new or changed, or refers to
+            # a changed or removed route, or any list could refer to
+            # different routes, as the signature of the list cache has
+            # changed
+            traveler_entry = (list_cache.signature, list_cache.digest(args.userlistfilepath+"/"+t), resolved[4])
+            if previous_travelers.get(traveler_lists[-1].traveler_name) != traveler_entry or \
+               any(route_by_root[root] in dirty_routes for root in resolved[4]):
+                dirty_travelers |= 1 << i
+            state.current['travelers'][traveler_lists[-1].traveler_name] = traveler_entry
+    list_files = None
+    resolved_lists = None
+    print(" processed " + str(len(traveler_lists)) + " traveler list files.")
+    if list_cache is not None:
+        print(et.et() + str(cached_lists) + " unchanged list files found. Writing list file cache " + args.listcachefile + ".", flush=True)
+        list_cache.save()
+        list_cache = None
+    wpt_digests = None
+    # label indices are no longer needed
+    for h in highway_systems:
+        for r in h.route_list:
+            r.label_index = None
+
+    profile.phase("updates_and_label_logs")
+    # Read updates.csv file, just keep in the fields array for now since we're
+    # just going to drop this into the DB later anyway
+    updates = []
+    print(et.et() + "Reading updates file.  ",end="",flush=True)
+    with open(args.highwaydatapath+"/updates.csv", "rt", encoding='UTF-8') as file:
+        lines = file.readlines()
+    file.close()
 
-lines.pop(0)  # ignore header line
-for line in lines:
-    fields = line.rstrip('\n').split(';')
-    if len(fields) != 5:
-        print("Could not parse updates.csv line: " + line)
-        continue
-    updates.append(fields)
-print("")
-
-# Same plan for systemupdates.csv file, again just keep in the fields
-# array for now since we're just going to drop this into the DB later
-# anyway
-systemupdates = []
-print(et.et() + "Reading systemupdates file.  ",end="",flush=True)
-with open(args.highwaydatapath+"/systemupdates.csv", "rt", encoding='UTF-8') as file:
-    lines = file.readlines()
-file.close()
+    lines.pop(0)  # ignore header line
+    for line in lines:
+        fields = line.rstrip('\n').split(';')
+        if len(fields) != 5:
+            print("Could not parse updates.csv line: " + line)
+            continue
+        updates.append(fields)
+    print("")
 
-lines.pop(0)  # ignore header line
-for line in lines:
-    fields = line.rstrip('\n').split(';')
-    if len(fields) != 5:
-        print("Could not parse systemupdates.csv line: " + line)
-        continue
-    systemupdates.append(fields)
-print("")
-
-# write log file for points in use -- might be more useful in the DB later,
-# or maybe in another format
-print(et.et() + "Writing points in use log.")
-inusefile = open(args.logfilepath+'/pointsinuse.log','w',encoding='UTF-8')
-inusefile.write("Log file created at: " + str(datetime.datetime.now()) + "\n")
-for h in highway_systems:
-    for r in h.route_list:
-        if len(r.labels_in_use) > 0:
-            inusefile.write(r.root + "(" + str(len(r.point_list)) + "):")
-            for label in sorted(r.labels_in_use):
-                inusefile.write(" " + label)
-            inusefile.write("\n")
-            r.labels_in_use = None
-inusefile.close()
-
-# write log file for alt labels not in use
-print(et.et() + "Writing unused alt labels log.")
-unusedfile = open(args.logfilepath+'/unusedaltlabels.log','w',encoding='UTF-8')
-unusedfile.write("Log file created at: " + str(datetime.datetime.now()) + "\n")
-total_unused_alt_labels = 0
-for h in highway_systems:
-    for r in h.route_list:
-        if len(r.unused_alt_labels) > 0:
-            total_unused_alt_labels += len(r.unused_alt_labels)
-            unusedfile.write(r.root + "(" + str(len(r.unused_alt_labels)) + "):")
-            for label in sorted(r.unused_alt_labels):
-                unusedfile.write(" " + label)
-            unusedfile.write("\n")
-            r.unused_alt_labels = None
-unusedfile.write("Total: " + str(total_unused_alt_labels) + "\n")
-unusedfile.close()
+    # Same plan for systemupdates.csv file, again just keep in the fields
+    # array for now since we're just going to drop this into the DB later
+    # anyway
+    systemupdates = []
+    print(et.et() + "Reading systemupdates file.  ",end="",flush=True)
+    with open(args.highwaydatapath+"/systemupdates.csv", "rt", encoding='UTF-8') as file:
+        lines = file.readlines()
+    file.close()
+
+    lines.pop(0)  # ignore header line
+    for line in lines:
+        fields = line.rstrip('\n').split(';')
+        if len(fields) != 5:
+            print("Could not parse systemupdates.csv line: " + line)
+            continue
+        systemupdates.append(fields)
+    print("")
 
+    # write log file for points in use -- might be more useful in the DB later,
+    # or maybe in another format
+    print(et.et() + "Writing points in use log.")
+    inusefile = LogFile(args.logfilepath+'/pointsinuse.log','UTF-8')
+    inusefile.write_header()
+    for h in highway_systems:
+        for r in h.route_list:
+            if len(r.labels_in_use) > 0:
+                inusefile.write(r.root + "(" + str(len(r.point_list)) + "): " +
+                                " ".join(sorted(r.labels_in_use)) + "\n")
+                r.labels_in_use = None
+    inusefile.close()
+
+    # write log file for alt labels not in use
+    print(et.et() + "Writing unused alt labels log.")
+    unusedfile = LogFile(args.logfilepath+'/unusedaltlabels.log','UTF-8')
+    unusedfile.write_header()
+    total_unused_alt_labels = 0
+    for h in highway_systems:
+        for r in h.route_list:
+            if len(r.unused_alt_labels) > 0:
+                total_unused_alt_labels += len(r.unused_alt_labels)
+                unusedfile.write(r.root + "(" + str(len(r.unused_alt_labels)) + "): " +
+                                 " ".join(sorted(r.unused_alt_labels)) + "\n")
+                r.unused_alt_labels = None
+    unusedfile.write("Total: " + str(total_unused_alt_labels) + "\n")
+    unusedfile.close()
 
 # concurrency detection -- will augment our structure with list of concurrent
 # segments with each segment (that has a concurrency)
+profile.phase("concurrency")
 print(et.et() + "Concurrent segment detection.",end="",flush=True)
-concurrencyfile = open(args.logfilepath+'/concurrencies.log','w',encoding='UTF-8')
-concurrencyfile.write("Log file created at: " + str(datetime.datetime.now()) + "\n")
+concurrencyfile = LogFile(args.logfilepath+'/concurrencies.log','UTF-8')
+concurrencyfile.write_header()
+# With an update state, only the segments whose concurrencies could
+# have changed since it was written are checked again: those of
+# changed routes, those that were concurrent with a segment of a
+# changed or removed route, and, in turn, any segment found
+# concurrent with one checked and all those it was concurrent with.
+# Any other segment cannot be concurrent with one checked, so gets the
+# concurrent list and log lines it had, with the segments of each
+# list (groups in the state) by route root and index in the route
+recheck_segments = None
+if incremental:
+    previous_concurrencies = state.section('concurrencies')
+    previous_groups = state.section('groups')
+    recheck_segments = set()
+    segments_to_check = []
+    for r in dirty_routes:
+        segments_to_check.extend(r.segment_list)
+    for root in removed_roots.union(r.root for r in dirty_routes):
+        for (group_id, lines) in previous_concurrencies.get(root, dict()).values():
+            if group_id is not None:
+                for (other_root, i) in previous_groups[group_id]:
+                    other_r = route_by_root.get(other_root)
+                    if other_r is not None and other_r not in dirty_routes:
+                        segments_to_check.append(other_r.segment_list[i])
+    while len(segments_to_check) > 0:
+        s = segments_to_check.pop()
+        if s in recheck_segments:
+            continue
+        recheck_segments.add(s)
+        r = s.route
+        if r not in dirty_routes:
+            group_id = previous_concurrencies.get(r.root, dict()).get(s.segment_id - r.segment_list[0].segment_id, (None,))[0]
+            if group_id is not None:
+                for (other_root, i) in previous_groups[group_id]:
+                    other_r = route_by_root.get(other_root)
+                    if other_r is not None and other_r not in dirty_routes:
+                        segments_to_check.append(other_r.segment_list[i])
+        if s.waypoint1.colocated is not None and s.waypoint2.colocated is not None:
+            for w1 in s.waypoint1.colocated:
+                if w1.route is not r:
+                    for w2 in s.waypoint2.colocated:
+                        other = w1.route.find_segment_by_waypoints(w1,w2)
+                        if other is not None:
+                            segments_to_check.append(other)
+    segments_to_check = None
+    print(" " + str(len(recheck_segments)) + " segments to check",end="",flush=True)
+# index the segments that could be concurrent with others, those with
+# both endpoints colocated, by their endpoints in both directions, so
+# the segment between any two waypoints is found with a single lookup
+# rather than a search of its route's segment list
+segment_by_waypoints = dict()
+for h in highway_systems:
+    for r in h.route_list:
+        for s in r.segment_list:
+            if s.waypoint1.colocated is not None and s.waypoint2.colocated is not None and \
+               (recheck_segments is None or s in recheck_segments):
+                segment_by_waypoints[(s.waypoint1,s.waypoint2)] = s
+                segment_by_waypoints[(s.waypoint2,s.waypoint1)] = s
+# the log lines of each segment, to be kept in the update state, and
+# the concurrent lists restored from it by group id
+segment_lines = dict()
+restored_groups = dict()
 for h in highway_systems:
     print(".",end="",flush=True)
     for r in h.route_list:
         for s in r.segment_list:
+            if recheck_segments is not None and s not in recheck_segments:
+                saved = previous_concurrencies.get(r.root, dict()).get(s.segment_id - r.segment_list[0].segment_id)
+                if saved is not None:
+                    (group_id, lines) = saved
+                    if group_id is not None:
+                        if group_id not in restored_groups:
+                            restored_groups[group_id] = [route_by_root[other_root].segment_list[i]
+                                                         for (other_root, i) in previous_groups[group_id]]
+                        s.concurrent = restored_groups[group_id]
+                    if len(lines) > 0:
+                        concurrencyfile.write_lines(lines)
+                        segment_lines[s] = lines
+                continue
             if s.waypoint1.colocated is not None and s.waypoint2.colocated is not None:
+                lines = []
                 for w1 in s.waypoint1.colocated:
                     if w1.route is not r:
                         for w2 in s.waypoint2.colocated:
-                            if w1.route is w2.route:
-                                other = w1.route.find_segment_by_waypoints(w1,w2)
-                                if other is not None:
-                                    if s.concurrent is None:
-                                        s.concurrent = []
-                                        other.concurrent = s.concurrent
-                                        s.concurrent.append(s)
+                            # a segment is only found between two
+                            # waypoints of the same route
+                            other = segment_by_waypoints.get((w1,w2))
+                            if other is not None:
+                                if s.concurrent is None:
+                                    s.concurrent = []
+                                    other.concurrent = s.concurrent
+                                    s.concurrent.append(s)
+                                    s.concurrent.append(other)
+                                    lines.append("New concurrency [" + str(s) + "][" + str(other) + "] (" + str(len(s.concurrent)) + ")")
+                                else:
+                                    other.concurrent = s.concurrent
+                                    if other not in s.concurrent:
                                         s.concurrent.append(other)
-                                        concurrencyfile.write("New concurrency [" + str(s) + "][" + str(other) + "] (" + str(len(s.concurrent)) + ")\n")
-                                    else:
-                                        other.concurrent = s.concurrent
-                                        if other not in s.concurrent:
-                                            s.concurrent.append(other)
-                                            #concurrencyfile.write("Added concurrency [" + str(s) + "]-[" + str(other) + "] ("+ str(len(s.concurrent)) + ")\n")
-                                            concurrencyfile.write("Extended concurrency ")
-                                            for x in s.concurrent:
-                                                concurrencyfile.write("[" + str(x) + "]")
-                                            concurrencyfile.write(" (" + str(len(s.concurrent)) + ")\n")
+                                        #lines.append("Added concurrency [" + str(s) + "]-[" + str(other) + "] ("+ str(len(s.concurrent)) + ")")
+                                        lines.append("Extended concurrency " +
+                                                     "".join("[" + str(x) + "]" for x in s.concurrent) +
+                                                     " (" + str(len(s.concurrent)) + ")")
+                if len(lines) > 0:
+                    concurrencyfile.write_lines(lines)
+                    if state is not None:
+                        segment_lines[s] = lines
 print("!")
 
-# now augment any traveler clinched segments for concurrencies
-
-print(et.et() + "Augmenting travelers for detected concurrent segments.",end="",flush=True)
-for t in traveler_lists:
-    print(".",end="",flush=True)
-    for s in t.clinched_segments:
-        if s.concurrent is not None:
-            for hs in s.concurrent:
-                if hs.route.system.active_or_preview() and hs.add_clinched_by(t):
-                    concurrencyfile.write("Concurrency augment for traveler " + t.traveler_name + ": [" + str(hs) + "] based on [" + str(s) + "]\n")
-print("!")
-concurrencyfile.close()
+segment_by_waypoints = None
 
-# compute lots of stats, first total mileage by route, system, overall, where
-# system and overall are stored in dictionaries by region
-print(et.et() + "Computing stats.",end="",flush=True)
-# now also keeping separate totals for active only, active+preview,
-# and all for overall (not needed for system, as a system falls into just
-# one of these categories)
-active_only_mileage_by_region = dict()
-active_preview_mileage_by_region = dict()
-overall_mileage_by_region = dict()
+# the distinct concurrent lists, in the order of the first segment
+# referring to each
+concurrency_groups = []
+seen_groups = set()
 for h in highway_systems:
-    print(".",end="",flush=True)
     for r in h.route_list:
         for s in r.segment_list:
-            segment_length = s.length()
-            # always add the segment mileage to the route
-            r.mileage += segment_length
-            # but we do need to check for concurrencies for others
-            system_concurrency_count = 1
-            active_only_concurrency_count = 1
-            active_preview_concurrency_count = 1
-            overall_concurrency_count = 1
-            if s.concurrent is not None:
-                for other in s.concurrent:
-                    if other != s:
-                        overall_concurrency_count += 1
-                        if other.route.system.active_or_preview():
-                            active_preview_concurrency_count += 1
-                            if other.route.system.active():
-                                active_only_concurrency_count += 1
-                        if other.route.system == r.system:
-                            system_concurrency_count += 1
-            # we know how many times this segment will be encountered
-            # in both the system and overall/active+preview/active-only
-            # routes, so let's add in the appropriate (possibly fractional)
-            # mileage to the overall totals and to the system categorized
-            # by its region
-            #
-            # first, overall mileage for this region, add to overall
-            # if an entry already exists, create entry if not
-            if r.region in overall_mileage_by_region:
-                overall_mileage_by_region[r.region] = overall_mileage_by_region[r.region] + \
-                    segment_length/overall_concurrency_count
-            else:
-                overall_mileage_by_region[r.region] = segment_length/overall_concurrency_count
-
-            # next, same thing for active_preview mileage for the region,
-            # if active or preview
-            if r.system.active_or_preview():
-                if r.region in active_preview_mileage_by_region:
-                    active_preview_mileage_by_region[r.region] = active_preview_mileage_by_region[r.region] + \
-                    segment_length/active_preview_concurrency_count
-                else:
-                    active_preview_mileage_by_region[r.region] = segment_length/active_preview_concurrency_count
-
-            # now same thing for active_only mileage for the region,
-            # if active
-            if r.system.active():
-                if r.region in active_only_mileage_by_region:
-                    active_only_mileage_by_region[r.region] = active_only_mileage_by_region[r.region] + \
-                    segment_length/active_only_concurrency_count
-                else:
-                    active_only_mileage_by_region[r.region] = segment_length/active_only_concurrency_count
-
-            # now we move on to totals by region, only the
-            # overall since an entire highway system must be
-            # at the same level
-            if r.region in h.mileage_by_region:
-                h.mileage_by_region[r.region] = h.mileage_by_region[r.region] + \
-                        segment_length/system_concurrency_count
-            else:
-                h.mileage_by_region[r.region] = segment_length/system_concurrency_count
-
-            # that's it for overall stats, now credit all travelers
-            # who have clinched this segment in their stats
-            for t in s.clinched_by:
-                # credit active+preview for this region, which it must be
-                # if this segment is clinched by anyone but still check
-                # in case a concurrency detection might otherwise credit
-                # a traveler with miles in a devel system
-                if r.system.active_or_preview():
-                    if r.region in t.active_preview_mileage_by_region:
-                        t.active_preview_mileage_by_region[r.region] = t.active_preview_mileage_by_region[r.region] + \
-                            segment_length/active_preview_concurrency_count
+            if s.concurrent is not None and id(s.concurrent) not in seen_groups:
+                seen_groups.add(id(s.concurrent))
+                concurrency_groups.append(s.concurrent)
+seen_groups = None
+
+# keep the concurrent lists and log lines in the update state, and note
+# the lists restored from it, whose augments can also be restored
+restored_group_ids = dict()
+for (group_id, group) in restored_groups.items():
+    restored_group_ids[id(group)] = group_id
+restored_groups = None
+if state is not None:
+    group_ids = dict()
+    state.current['groups'] = dict()
+    for group in concurrency_groups:
+        group_ids[id(group)] = len(group_ids)
+        state.current['groups'][group_ids[id(group)]] = \
+            [(x.route.root, x.segment_id - x.route.segment_list[0].segment_id) for x in group]
+    state.current['concurrencies'] = dict()
+    for h in highway_systems:
+        for r in h.route_list:
+            route_concurrencies = dict()
+            for i in range(len(r.segment_list)):
+                s = r.segment_list[i]
+                if s.concurrent is not None or s in segment_lines:
+                    route_concurrencies[i] = (None if s.concurrent is None else group_ids[id(s.concurrent)],
+                                              segment_lines.get(s, []))
+            if len(route_concurrencies) > 0:
+                state.current['concurrencies'][r.root] = route_concurrencies
+segment_lines = None
+previous_concurrencies = None
+previous_groups = None
+
+if not args.errorcheck:
+    # now augment any traveler clinched segments for concurrencies
+
+    print(et.et() + "Augmenting travelers for detected concurrent segments.",end="",flush=True)
+    # a traveler who has clinched a segment is credited with each active or
+    # preview segment in its concurrent list, so this is done once per list
+    # (shared by the segments whose concurrent field refers to it) with the
+    # bitmap of all travelers who clinched any of those segments, found for
+    # every list before any segments are augmented, along with the
+    # segments themselves and their own bitmaps to log the augments.
+    # With an update state, the augments of the travelers whose lists
+    # are unchanged (see dirty_travelers) on a concurrent list restored
+    # from the state are those kept with it, as the segments of the
+    # list and those travelers' segments are all unchanged
+    previous_augments = state.section('augments') if incremental else dict()
+    if state is not None:
+        state.current['augments'] = dict()
+    traveler_by_name = dict()
+    for t in traveler_lists:
+        traveler_by_name[t.traveler_name] = t
+    augment_groups = []
+    for group in concurrency_groups:
+        clinchers = 0
+        sources = []
+        for x in group:
+            if x.concurrent is group and x.clinched_by:
+                clinchers |= x.clinched_by
+                sources.append((x, x.clinched_by))
+        if clinchers:
+            augment_groups.append((group, clinchers, sources))
+    augment_lines = [[] for t in traveler_lists]
+    for (group, clinchers, sources) in augment_groups:
+        # (traveler name, index in list, log line) of each augment
+        augments = []
+        if id(group) in restored_group_ids:
+            for (traveler_name, index, line) in previous_augments.get(restored_group_ids[id(group)], ()):
+                t = traveler_by_name.get(traveler_name)
+                if t is not None and not dirty_travelers >> t.traveler_num & 1:
+                    group[index].clinched_by |= 1 << t.traveler_num
+                    augment_lines[t.traveler_num].append(line)
+                    augments.append((traveler_name, index, line))
+            clinchers &= dirty_travelers
+        for index in range(len(group)):
+            hs = group[index]
+            if hs.route.system.active_or_preview():
+                bits = clinchers & ~hs.clinched_by
+                hs.clinched_by |= bits
+                while bits:
+                    lowest = bits & -bits
+                    bits ^= lowest
+                    t = traveler_lists[lowest.bit_length()-1]
+                    # log the first segment of the list this traveler clinched
+                    for (s, s_clinched_by) in sources:
+                        if s_clinched_by & lowest:
+                            break
+                    line = "Concurrency augment for traveler " + t.traveler_name + ": [" + str(hs) + "] based on [" + str(s) + "]"
+                    augment_lines[t.traveler_num].append(line)
+                    if state is not None:
+                        augments.append((t.traveler_name, index, line))
+        if len(augments) > 0:
+            state.current['augments'][group_ids[id(group)]] = augments
+    augment_groups = None
+    previous_augments = None
+    for lines in augment_lines:
+        concurrencyfile.write_lines(lines)
+    print("!")
+
+concurrencyfile.close()
+
+if args.errorcheck:
+    print(et.et() + "SKIPPING stats, traveler logs and stats csv files.", flush=True)
+else:
+    # compute lots of stats, first total mileage by route, system, overall, where
+    # system and overall are stored in dictionaries by region
+    profile.phase("stats")
+    print(et.et() + "Computing stats.",end="",flush=True)
+    # now also keeping separate totals for active only, active+preview,
+    # and all for overall (not needed for system, as a system falls into just
+    # one of these categories)
+    active_only_mileage_by_region = dict()
+    active_preview_mileage_by_region = dict()
+    overall_mileage_by_region = dict()
+    # With an update state, the travelers' stats are computed only for
+    # those whose lists are changed (see dirty_travelers), or who have
+    # clinched segments of routes with any segment whose concurrencies
+    # were checked again, now or when the state was written, and taken
+    # from the state for all others, whose clinched segments and their
+    # concurrencies are all unchanged.  stats_travelers has the bits of
+    # those computed, as in HighwaySegment.clinched_by
+    stats_travelers = dirty_travelers
+    if incremental:
+        previous_stats = state.section('traveler_stats')
+        rechecked_routes = set()
+        for s in recheck_segments:
+            rechecked_routes.add(s.route)
+        for r in rechecked_routes:
+            for s in r.segment_list:
+                stats_travelers |= s.clinched_by
+        rechecked_roots = removed_roots.union(r.root for r in rechecked_routes)
+        for t in traveler_lists:
+            saved = previous_stats.get(t.traveler_name)
+            if saved is None or any(root in rechecked_roots for (root, miles) in saved[0]):
+                stats_travelers |= 1 << t.traveler_num
+        rechecked_routes = None
+        rechecked_roots = None
+    if numpy is not None:
+        compute_mileage_stats(highway_systems, traveler_lists, concurrency_groups,
+                              overall_mileage_by_region,
+                              active_preview_mileage_by_region,
+                              active_only_mileage_by_region,
+                              stats_travelers)
+    else:
+        for h in highway_systems:
+            print(".",end="",flush=True)
+            for r in h.route_list:
+                for s in r.segment_list:
+                    segment_length = s.length()
+                    # always add the segment mileage to the route
+                    r.mileage += segment_length
+                    # but we do need to check for concurrencies for others
+                    system_concurrency_count = 1
+                    active_only_concurrency_count = 1
+                    active_preview_concurrency_count = 1
+                    overall_concurrency_count = 1
+                    if s.concurrent is not None:
+                        for other in s.concurrent:
+                            if other != s:
+                                overall_concurrency_count += 1
+                                if other.route.system.active_or_preview():
+                                    active_preview_concurrency_count += 1
+                                    if other.route.system.active():
+                                        active_only_concurrency_count += 1
+                                if other.route.system == r.system:
+                                    system_concurrency_count += 1
+                    # we know how many times this segment will be encountered
+                    # in both the system and overall/active+preview/active-only
+                    # routes, so let's add in the appropriate (possibly fractional)
+                    # mileage to the overall totals and to the system categorized
+                    # by its region
+                    #
+                    # first, overall mileage for this region, add to overall
+                    # if an entry already exists, create entry if not
+                    if r.region in overall_mileage_by_region:
+                        overall_mileage_by_region[r.region] = overall_mileage_by_region[r.region] + \
+                            segment_length/overall_concurrency_count
                     else:
-                        t.active_preview_mileage_by_region[r.region] = segment_length/active_preview_concurrency_count
+                        overall_mileage_by_region[r.region] = segment_length/overall_concurrency_count
 
-                # credit active only for this region
-                if r.system.active():
-                    if r.region in t.active_only_mileage_by_region:
-                        t.active_only_mileage_by_region[r.region] = t.active_only_mileage_by_region[r.region] + \
+                    # next, same thing for active_preview mileage for the region,
+                    # if active or preview
+                    if r.system.active_or_preview():
+                        if r.region in active_preview_mileage_by_region:
+                            active_preview_mileage_by_region[r.region] = active_preview_mileage_by_region[r.region] + \
+                            segment_length/active_preview_concurrency_count
+                        else:
+                            active_preview_mileage_by_region[r.region] = segment_length/active_preview_concurrency_count
+
+                    # now same thing for active_only mileage for the region,
+                    # if active
+                    if r.system.active():
+                        if r.region in active_only_mileage_by_region:
+                            active_only_mileage_by_region[r.region] = active_only_mileage_by_region[r.region] + \
                             segment_length/active_only_concurrency_count
+                        else:
+                            active_only_mileage_by_region[r.region] = segment_length/active_only_concurrency_count
+
+                    # now we move on to totals by region, only the
+                    # overall since an entire highway system must be
+                    # at the same level
+                    if r.region in h.mileage_by_region:
+                        h.mileage_by_region[r.region] = h.mileage_by_region[r.region] + \
+                                segment_length/system_concurrency_count
                     else:
-                        t.active_only_mileage_by_region[r.region] = segment_length/active_only_concurrency_count
-
-
-                # credit this system in this region in the messy dictionary
-                # of dictionaries, but skip devel system entries
-                if r.system.active_or_preview():
-                    if h.systemname not in t.system_region_mileages:
-                        t.system_region_mileages[h.systemname] = dict()
-                    t_system_dict = t.system_region_mileages[h.systemname]
-                    if r.region in t_system_dict:
-                        t_system_dict[r.region] = t_system_dict[r.region] + \
-                        segment_length/system_concurrency_count
-                    else:
-                        t_system_dict[r.region] = segment_length/system_concurrency_count
-print("!", flush=True)
+                        h.mileage_by_region[r.region] = segment_length/system_concurrency_count
+
+                    # that's it for overall stats, now credit all travelers
+                    # who have clinched this segment in their stats
+                    for t in s.clinched_by_travelers(traveler_lists, stats_travelers):
+                        # credit the route, adding segments in order so the
+                        # total is the same as summing the traveler's
+                        # clinched segments along the route
+                        if r in t.clinched_route_mileage:
+                            t.clinched_route_mileage[r] += segment_length
+                        else:
+                            t.clinched_route_mileage[r] = segment_length
+
+                        # credit active+preview for this region, which it must be
+                        # if this segment is clinched by anyone but still check
+                        # in case a concurrency detection might otherwise credit
+                        # a traveler with miles in a devel system
+                        if r.system.active_or_preview():
+                            if r.region in t.active_preview_mileage_by_region:
+                                t.active_preview_mileage_by_region[r.region] = t.active_preview_mileage_by_region[r.region] + \
+                                    segment_length/active_preview_concurrency_count
+                            else:
+                                t.active_preview_mileage_by_region[r.region] = segment_length/active_preview_concurrency_count
 
-print(et.et() + "Writing highway data stats log file (highwaydatastats.log).",flush=True)
-hdstatsfile = open(args.logfilepath+"/highwaydatastats.log","wt",encoding='UTF-8')
-hdstatsfile.write("Travel Mapping highway mileage as of " + str(datetime.datetime.now()) + '\n')
-active_only_miles = math.fsum(list(active_only_mileage_by_region.values()))
-hdstatsfile.write("Active routes (active): " + "{0:.2f}".format(active_only_miles) + " mi\n")
-active_preview_miles = math.fsum(list(active_preview_mileage_by_region.values()))
-hdstatsfile.write("Clinchable routes (active, preview): " + "{0:.2f}".format(active_preview_miles) + " mi\n")
-overall_miles = math.fsum(list(overall_mileage_by_region.values()))
-hdstatsfile.write("All routes (active, preview, devel): " + "{0:.2f}".format(overall_miles) + " mi\n")
-hdstatsfile.write("Breakdown by region:\n")
-# let's sort alphabetically by region instead of using whatever order
-# comes out of the dictionary
-# a nice enhancement later here might break down by continent, then country,
-# then region
-region_entries = []
-for region in list(overall_mileage_by_region.keys()):
-    # look up active+preview and active-only mileages if they exist
-    if region in list(active_preview_mileage_by_region.keys()):
-        region_active_preview_miles = active_preview_mileage_by_region[region]
-    else:
-        region_active_preview_miles = 0.0
-    if region in list(active_only_mileage_by_region.keys()):
-        region_active_only_miles = active_only_mileage_by_region[region]
-    else:
-        region_active_only_miles = 0.0
+                        # credit active only for this region
+                        if r.system.active():
+                            if r.region in t.active_only_mileage_by_region:
+                                t.active_only_mileage_by_region[r.region] = t.active_only_mileage_by_region[r.region] + \
+                                    segment_length/active_only_concurrency_count
+                            else:
+                                t.active_only_mileage_by_region[r.region] = segment_length/active_only_concurrency_count
+
+
+                        # credit this system in this region in the messy dictionary
+                        # of dictionaries, but skip devel system entries
+                        if r.system.active_or_preview():
+                            if h.systemname not in t.system_region_mileages:
+                                t.system_region_mileages[h.systemname] = dict()
+                            t_system_dict = t.system_region_mileages[h.systemname]
+                            if r.region in t_system_dict:
+                                t_system_dict[r.region] = t_system_dict[r.region] + \
+                                segment_length/system_concurrency_count
+                            else:
+                                t_system_dict[r.region] = segment_length/system_concurrency_count
+    print("!", flush=True)
+    if incremental:
+        for t in traveler_lists:
+            if not stats_travelers >> t.traveler_num & 1:
+                (route_mileages, t.active_preview_mileage_by_region, t.active_only_mileage_by_region,
+                 t.system_region_mileages) = previous_stats[t.traveler_name]
+                for (root, miles) in route_mileages:
+                    t.clinched_route_mileage[route_by_root[root]] = miles
+        previous_stats = None
+    if state is not None:
+        state.current['traveler_stats'] = dict()
+        for t in traveler_lists:
+            state.current['traveler_stats'][t.traveler_name] = \
+                ([(r.root, miles) for (r, miles) in t.clinched_route_mileage.items()],
+                 t.active_preview_mileage_by_region, t.active_only_mileage_by_region,
+                 t.system_region_mileages)
+
+    print(et.et() + "Writing highway data stats log file (highwaydatastats.log).",flush=True)
+    hdstatsfile = open(args.logfilepath+"/highwaydatastats.log","wt",encoding='UTF-8')
+    hdstatsfile.write("Travel Mapping highway mileage as of " + str(datetime.datetime.now()) + '\n')
+    active_only_miles = math.fsum(list(active_only_mileage_by_region.values()))
+    hdstatsfile.write("Active routes (active): " + "{0:.2f}".format(active_only_miles) + " mi\n")
+    active_preview_miles = math.fsum(list(active_preview_mileage_by_region.values()))
+    hdstatsfile.write("Clinchable routes (active, preview): " + "{0:.2f}".format(active_preview_miles) + " mi\n")
+    overall_miles = math.fsum(list(overall_mileage_by_region.values()))
+    hdstatsfile.write("All routes (active, preview, devel): " + "{0:.2f}".format(overall_miles) + " mi\n")
+    hdstatsfile.write("Breakdown by region:\n")
+    # let's sort alphabetically by region instead of using whatever order
+    # comes out of the dictionary
+    # a nice enhancement later here might break down by continent, then country,
+    # then region
+    region_entries = []
+    for region in list(overall_mileage_by_region.keys()):
+        # look up active+preview and active-only mileages if they exist
+        if region in list(active_preview_mileage_by_region.keys()):
+            region_active_preview_miles = active_preview_mileage_by_region[region]
+        else:
+            region_active_preview_miles = 0.0
+        if region in list(active_only_mileage_by_region.keys()):
+            region_active_only_miles = active_only_mileage_by_region[region]
+        else:
+            region_active_only_miles = 0.0
 
-    region_entries.append(region + ": " +
-                          "{0:.2f}".format(region_active_only_miles) + " (active), " +
-                          "{0:.2f}".format(region_active_preview_miles) + " (active, preview) " +
-                          "{0:.2f}".format(overall_mileage_by_region[region]) + " (active, preview, devel)\n")
-region_entries.sort()
-for e in region_entries:
-    hdstatsfile.write(e)
+        region_entries.append(region + ": " +
+                              "{0:.2f}".format(region_active_only_miles) + " (active), " +
+                              "{0:.2f}".format(region_active_preview_miles) + " (active, preview) " +
+                              "{0:.2f}".format(overall_mileage_by_region[region]) + " (active, preview, devel)\n")
+    region_entries.sort()
+    for e in region_entries:
+        hdstatsfile.write(e)
 
-for h in highway_systems:
-    hdstatsfile.write("System " + h.systemname + " (" + h.level + ") total: "
-                      + "{0:.2f}".format(math.fsum(list(h.mileage_by_region.values()))) \
-                             + ' mi\n')
-    if len(h.mileage_by_region) > 1:
-        hdstatsfile.write("System " + h.systemname + " by region:\n")
-        for region in sorted(h.mileage_by_region.keys()):
-            hdstatsfile.write(region + ": " + "{0:.2f}".format(h.mileage_by_region[region]) + " mi\n")
-    hdstatsfile.write("System " + h.systemname + " by route:\n")
-    for cr in h.con_route_list:
-        con_total_miles = 0.0
-        to_write = ""
-        for r in cr.roots:
-            to_write += "  " + r.readable_name() + ": " + "{0:.2f}".format(r.mileage) + " mi\n"
-            con_total_miles += r.mileage
-        cr.mileage = con_total_miles
-        hdstatsfile.write(cr.readable_name() + ": " + "{0:.2f}".format(con_total_miles) + " mi")
-        if len(cr.roots) == 1:
-            hdstatsfile.write(" (" + cr.roots[0].readable_name() + " only)\n")
-        else:
-            hdstatsfile.write("\n" + to_write)
-
-hdstatsfile.close()
-# this will be used to store DB entry lines for clinchedSystemMileageByRegion
-# table as needed values are computed here, to be added into the DB
-# later in the program
-csmbr_values = []
-# and similar for DB entry lines for clinchedConnectedRoutes table
-# and clinchedRoutes table
-ccr_values = []
-cr_values = []
-# now add user clinched stats to their log entries
-print(et.et() + "Creating per-traveler stats log entries and augmenting data structure.",end="",flush=True)
-for t in traveler_lists:
-    print(".",end="",flush=True)
-    t.log_entries.append("Clinched Highway Statistics")
-    t_active_only_miles = math.fsum(list(t.active_only_mileage_by_region.values()))
-    t.log_entries.append("Overall in active systems: " + format_clinched_mi(t_active_only_miles,active_only_miles))
-    t_active_preview_miles = math.fsum(list(t.active_preview_mileage_by_region.values()))
-    t.log_entries.append("Overall in active+preview systems: " + format_clinched_mi(t_active_preview_miles,active_preview_miles))
-
-    t.log_entries.append("Overall by region: (each line reports active only then active+preview)")
-    for region in sorted(t.active_preview_mileage_by_region.keys()):
-        t_active_miles = 0.0
-        total_active_miles = 0.0
-        if region in list(t.active_only_mileage_by_region.keys()):
-            t_active_miles = t.active_only_mileage_by_region[region]
-            total_active_miles = active_only_mileage_by_region[region]
-        t.log_entries.append(region + ": " +
-                             format_clinched_mi(t_active_miles, total_active_miles) +
-                             ", " +
-                             format_clinched_mi(t.active_preview_mileage_by_region[region],
-                                                active_preview_mileage_by_region[region]))
-
-    t.active_systems_traveled = 0
-    t.active_systems_clinched = 0
-    t.preview_systems_traveled = 0
-    t.preview_systems_clinched = 0
-    active_systems = 0
-    preview_systems = 0
-    # "traveled" dictionaries indexed by system name, then conn or regular
-    # route in another dictionary with keys route, values mileage
-    # "clinched" dictionaries indexed by system name, values clinch count
-    t.con_routes_traveled = dict()
-    t.con_routes_clinched = dict()
-    t.routes_traveled = dict()
-    #t.routes_clinched = dict()
-
-    # present stats by system here, also generate entries for
-    # DB table clinchedSystemMileageByRegion as we compute and
-    # have the data handy
     for h in highway_systems:
-        if h.active_or_preview():
-            if h.active():
-                active_systems += 1
+        hdstatsfile.write("System " + h.systemname + " (" + h.level + ") total: "
+                          + "{0:.2f}".format(math.fsum(list(h.mileage_by_region.values()))) \
+                                 + ' mi\n')
+        if len(h.mileage_by_region) > 1:
+            hdstatsfile.write("System " + h.systemname + " by region:\n")
+            for region in sorted(h.mileage_by_region.keys()):
+                hdstatsfile.write(region + ": " + "{0:.2f}".format(h.mileage_by_region[region]) + " mi\n")
+        hdstatsfile.write("System " + h.systemname + " by route:\n")
+        for cr in h.con_route_list:
+            con_total_miles = 0.0
+            to_write = ""
+            for r in cr.roots:
+                to_write += "  " + r.readable_name() + ": " + "{0:.2f}".format(r.mileage) + " mi\n"
+                con_total_miles += r.mileage
+            cr.mileage = con_total_miles
+            hdstatsfile.write(cr.readable_name() + ": " + "{0:.2f}".format(con_total_miles) + " mi")
+            if len(cr.roots) == 1:
+                hdstatsfile.write(" (" + cr.roots[0].readable_name() + " only)\n")
             else:
-                preview_systems += 1
-            t_system_overall = 0.0
-            if h.systemname in t.system_region_mileages:
-                t_system_overall = math.fsum(list(t.system_region_mileages[h.systemname].values()))
-            t.log_entries.append("System " + h.systemname + " (" + h.level +
-                                 ") overall: " +
-                                 format_clinched_mi(t_system_overall, math.fsum(list(h.mileage_by_region.values()))))
-            if t_system_overall > 0.0:
-                if h.active():
-                    t.active_systems_traveled += 1
-                else:
-                    t.preview_systems_traveled += 1
-            if t_system_overall == math.fsum(list(h.mileage_by_region.values())):
+                hdstatsfile.write("\n" + to_write)
+
+    hdstatsfile.close()
+    # this will be used to store DB entry lines for clinchedSystemMileageByRegion
+    # table as needed values are computed here, to be added into the DB
+    # later in the program
+    csmbr_values = []
+    # and similar for DB entry lines for clinchedConnectedRoutes table
+    # and clinchedRoutes table
+    ccr_values = []
+    cr_values = []
+    # The stats of a traveler in a system, for the log entries and DB
+    # entries, depend only on the traveler's stats (see above) and the
+    # system's routes, connected routes and mileages.  They are
+    # computed by this function, which returns a tuple of:
+    #
+    # log_entries: lines for the traveler's log
+    # traveled, clinched: whether any or all of the system is clinched
+    # csmbr, cr, ccr: entries for the clinchedSystemMileageByRegion,
+    # clinchedRoutes and clinchedConnectedRoutes DB tables
+    # con_routes: (index in con_route_list, miles) of each connected
+    # route traveled, or None if none are
+    # con_routes_clinched: the number of connected routes clinched
+    # routes: (index in con_route_list, index in roots, miles) of each
+    # route traveled
+    def traveler_system_stats(t, h):
+        log_entries = []
+        csmbr = []
+        cr_entries = []
+        ccr_entries = []
+        con_routes = None
+        con_routes_clinched = 0
+        routes = []
+        t_system_overall = 0.0
+        if h.systemname in t.system_region_mileages:
+            t_system_overall = math.fsum(list(t.system_region_mileages[h.systemname].values()))
+        log_entries.append("System " + h.systemname + " (" + h.level +
+                           ") overall: " +
+                           format_clinched_mi(t_system_overall, math.fsum(list(h.mileage_by_region.values()))))
+        traveled = t_system_overall > 0.0
+        clinched = t_system_overall == math.fsum(list(h.mileage_by_region.values()))
+
+        # stats by region covered by system, always in csmbr for
+        # the DB, but add to logs only if it's been traveled at
+        # all and it covers multiple regions
+        if t_system_overall > 0.0:
+            if len(h.mileage_by_region) > 1:
+                log_entries.append("System " + h.systemname + " by region:")
+            for region in sorted(h.mileage_by_region.keys()):
+                system_region_mileage = 0.0
+                if h.systemname in t.system_region_mileages and region in t.system_region_mileages[h.systemname]:
+                    system_region_mileage = t.system_region_mileages[h.systemname][region]
+                    csmbr.append("('" + h.systemname + "','" + region + "','"
+                                 + t.traveler_name + "','" +
+                                 str(system_region_mileage) + "')")
+                if len(h.mileage_by_region) > 1:
+                    log_entries.append("  " + region + ": " + \
+                                       format_clinched_mi(system_region_mileage, h.mileage_by_region[region]))
+
+        # stats by highway for the system, by connected route and
+        # by each segment crossing region boundaries if applicable
+        if t_system_overall > 0.0:
+            con_routes = []
+            log_entries.append("System " + h.systemname + " by route (traveled routes only):")
+            for cr_num in range(len(h.con_route_list)):
+                cr = h.con_route_list[cr_num]
+                con_total_miles = 0.0
+                con_clinched_miles = 0.0
+                to_write = ""
+                for root_num in range(len(cr.roots)):
+                    r = cr.roots[root_num]
+                    # find traveled mileage on this by this user
+                    miles = t.clinched_route_mileage.get(r, 0.0)
+                    if miles > 0.0:
+                        if miles >= r.mileage:
+                            clinched_flag = '1'
+                        else:
+                            clinched_flag = '0'
+                        cr_entries.append("('" + r.root + "','" + t.traveler_name + "','" +
+                                          str(miles) + "','" + clinched_flag + "')")
+                        routes.append((cr_num, root_num, miles))
+                        con_clinched_miles += miles
+                        to_write += "  " + r.readable_name() + ": " + \
+                            format_clinched_mi(miles,r.mileage) + "\n"
+                    con_total_miles += r.mileage
+                if con_clinched_miles > 0:
+                    con_routes.append((cr_num, con_clinched_miles))
+                    clinched_flag = '0'
+                    if con_clinched_miles == con_total_miles:
+                        con_routes_clinched += 1
+                        clinched_flag = '1'
+                    ccr_entries.append("('" + cr.roots[0].root + "','" + t.traveler_name
+                                       + "','" + str(con_clinched_miles) + "','"
+                                       + clinched_flag + "')")
+                    log_entries.append(cr.readable_name() + ": " + \
+                                       format_clinched_mi(con_clinched_miles,con_total_miles))
+                    if len(cr.roots) == 1:
+                        log_entries.append(" (" + cr.roots[0].readable_name() + " only)")
+                    else:
+                        log_entries.append(to_write)
+            log_entries.append("System " + h.systemname + " connected routes traveled: " + \
+                               str(len(con_routes)) + " of " + \
+                               str(len(h.con_route_list)) + \
+                               " ({0:.1f}%)".format(100*len(con_routes)/len(h.con_route_list)) + \
+                               ", clinched: " + str(con_routes_clinched) + " of " + \
+                               str(len(h.con_route_list)) + \
+                               " ({0:.1f}%)".format(100*con_routes_clinched/len(h.con_route_list)) + \
+                               ".")
+        return (log_entries, traveled, clinched, csmbr, cr_entries, ccr_entries,
+                con_routes, con_routes_clinched, routes)
+
+    # With an update state, the stats of a traveler whose stats were
+    # taken from it in a system whose routes, connected routes and
+    # mileages are unchanged are also taken from it
+    previous_system_stats = state.section('system_stats') if incremental else dict()
+    unchanged_systems = set()
+    if state is not None:
+        previous_systems = state.section('systems')
+        state.current['systems'] = dict()
+        state.current['system_stats'] = dict()
+        for h in highway_systems:
+            system_entry = (sorted(h.mileage_by_region.items()),
+                            [(cr.readable_name(), [(r.root, r.readable_name(), r.mileage) for r in cr.roots])
+                             for cr in h.con_route_list])
+            state.current['systems'][h.systemname] = system_entry
+            if previous_systems.get(h.systemname) == system_entry:
+                unchanged_systems.add(h)
+        previous_systems = None
+
+    # now add user clinched stats to their log entries
+    print(et.et() + "Creating per-traveler stats log entries and augmenting data structure.",end="",flush=True)
+    for t in traveler_lists:
+        print(".",end="",flush=True)
+        t.log_entries.append("Clinched Highway Statistics")
+        t_active_only_miles = math.fsum(list(t.active_only_mileage_by_region.values()))
+        t.log_entries.append("Overall in active systems: " + format_clinched_mi(t_active_only_miles,active_only_miles))
+        t_active_preview_miles = math.fsum(list(t.active_preview_mileage_by_region.values()))
+        t.log_entries.append("Overall in active+preview systems: " + format_clinched_mi(t_active_preview_miles,active_preview_miles))
+
+        t.log_entries.append("Overall by region: (each line reports active only then active+preview)")
+        for region in sorted(t.active_preview_mileage_by_region.keys()):
+            t_active_miles = 0.0
+            total_active_miles = 0.0
+            if region in list(t.active_only_mileage_by_region.keys()):
+                t_active_miles = t.active_only_mileage_by_region[region]
+                total_active_miles = active_only_mileage_by_region[region]
+            t.log_entries.append(region + ": " +
+                                 format_clinched_mi(t_active_miles, total_active_miles) +
+                                 ", " +
+                                 format_clinched_mi(t.active_preview_mileage_by_region[region],
+                                                    active_preview_mileage_by_region[region]))
+
+        t.active_systems_traveled = 0
+        t.active_systems_clinched = 0
+        t.preview_systems_traveled = 0
+        t.preview_systems_clinched = 0
+        active_systems = 0
+        preview_systems = 0
+        # "traveled" dictionaries indexed by system name, then conn or regular
+        # route in another dictionary with keys route, values mileage
+        # "clinched" dictionaries indexed by system name, values clinch count
+        t.con_routes_traveled = dict()
+        t.con_routes_clinched = dict()
+        t.routes_traveled = dict()
+        #t.routes_clinched = dict()
+
+        # present stats by system here, also generate entries for
+        # DB table clinchedSystemMileageByRegion as we compute and
+        # have the data handy
+        if state is not None:
+            saved_system_stats = previous_system_stats.get(t.traveler_name, dict())
+            t_system_stats = dict()
+            state.current['system_stats'][t.traveler_name] = t_system_stats
+        for h in highway_systems:
+            if h.active_or_preview():
                 if h.active():
-                    t.active_systems_clinched += 1
+                    active_systems += 1
                 else:
-                    t.preview_systems_clinched += 1
+                    preview_systems += 1
+                system_stats = None
+                if h in unchanged_systems and not stats_travelers >> t.traveler_num & 1:
+                    system_stats = saved_system_stats.get(h.systemname)
+                if system_stats is None:
+                    system_stats = traveler_system_stats(t, h)
+                if state is not None:
+                    t_system_stats[h.systemname] = system_stats
+                (log_entries, traveled, clinched, csmbr, cr_entries, ccr_entries,
+                 con_routes, con_routes_clinched, routes) = system_stats
+                t.log_entries.extend(log_entries)
+                if traveled:
+                    if h.active():
+                        t.active_systems_traveled += 1
+                    else:
+                        t.preview_systems_traveled += 1
+                if clinched:
+                    if h.active():
+                        t.active_systems_clinched += 1
+                    else:
+                        t.preview_systems_clinched += 1
+                csmbr_values.extend(csmbr)
+                cr_values.extend(cr_entries)
+                ccr_values.extend(ccr_entries)
+                if con_routes is not None:
+                    system_con_dict = dict()
+                    for (cr_num, miles) in con_routes:
+                        system_con_dict[h.con_route_list[cr_num]] = miles
+                    t.con_routes_traveled[h.systemname] = system_con_dict
+                    t.con_routes_clinched[h.systemname] = con_routes_clinched
+                for (cr_num, root_num, miles) in routes:
+                    t.routes_traveled[h.con_route_list[cr_num].roots[root_num]] = miles
+
+
+        # grand summary, active only
+        t.log_entries.append("Traveled " + str(t.active_systems_traveled) + " of " + str(active_systems) +
+                             " ({0:.1f}%)".format(100*t.active_systems_traveled/active_systems) +
+                             ", Clinched " + str(t.active_systems_clinched) + " of " + str(active_systems) +
+                             " ({0:.1f}%)".format(100*t.active_systems_clinched/active_systems) +
+                             " active systems")
+        # grand summary, active+preview
+        t.log_entries.append("Traveled " + str(t.preview_systems_traveled) + " of " + str(preview_systems) +
+                             " ({0:.1f}%)".format(100*t.preview_systems_traveled/preview_systems) +
+                             ", Clinched " + str(t.preview_systems_clinched) + " of " + str(preview_systems) +
+                             " ({0:.1f}%)".format(100*t.preview_systems_clinched/preview_systems) +
+                             " preview systems")
+    print("!", flush=True)
 
-            # stats by region covered by system, always in csmbr for
-            # the DB, but add to logs only if it's been traveled at
-            # all and it covers multiple regions
-            if t_system_overall > 0.0:
-                if len(h.mileage_by_region) > 1:
-                    t.log_entries.append("System " + h.systemname + " by region:")
-                for region in sorted(h.mileage_by_region.keys()):
-                    system_region_mileage = 0.0
-                    if h.systemname in t.system_region_mileages and region in t.system_region_mileages[h.systemname]:
-                        system_region_mileage = t.system_region_mileages[h.systemname][region]
-                        csmbr_values.append("('" + h.systemname + "','" + region + "','"
-                                            + t.traveler_name + "','" +
-                                            str(system_region_mileage) + "')")
-                    if len(h.mileage_by_region) > 1:
-                        t.log_entries.append("  " + region + ": " + \
-                                                 format_clinched_mi(system_region_mileage, h.mileage_by_region[region]))
-
-            # stats by highway for the system, by connected route and
-            # by each segment crossing region boundaries if applicable
-            if t_system_overall > 0.0:
-                system_con_dict = dict()
-                t.con_routes_traveled[h.systemname] = system_con_dict
-                con_routes_clinched = 0
-                t.log_entries.append("System " + h.systemname + " by route (traveled routes only):")
-                for cr in h.con_route_list:
-                    con_total_miles = 0.0
-                    con_clinched_miles = 0.0
-                    to_write = ""
-                    for r in cr.roots:
-                        # find traveled mileage on this by this user
-                        miles = r.clinched_by_traveler(t)
-                        if miles > 0.0:
-                            if miles >= r.mileage:
-                                clinched = '1'
-                            else:
-                                clinched = '0'
-                            cr_values.append("('" + r.root + "','" + t.traveler_name + "','" +
-                                             str(miles) + "','" + clinched + "')")
-                            t.routes_traveled[r] = miles
-                            con_clinched_miles += miles
-                            to_write += "  " + r.readable_name() + ": " + \
-                                format_clinched_mi(miles,r.mileage) + "\n"
-                        con_total_miles += r.mileage
-                    if con_clinched_miles > 0:
-                        system_con_dict[cr] = con_clinched_miles
-                        clinched = '0'
-                        if con_clinched_miles == con_total_miles:
-                            con_routes_clinched += 1
-                            clinched = '1'
-                        ccr_values.append("('" + cr.roots[0].root + "','" + t.traveler_name
-                                          + "','" + str(con_clinched_miles) + "','"
-                                          + clinched + "')")
-                        t.log_entries.append(cr.readable_name() + ": " + \
-                                             format_clinched_mi(con_clinched_miles,con_total_miles))
-                        if len(cr.roots) == 1:
-                            t.log_entries.append(" (" + cr.roots[0].readable_name() + " only)")
-                        else:
-                            t.log_entries.append(to_write)
-                t.con_routes_clinched[h.systemname] = con_routes_clinched
-                t.log_entries.append("System " + h.systemname + " connected routes traveled: " + \
-                                         str(len(system_con_dict)) + " of " + \
-                                         str(len(h.con_route_list)) + \
-                                         " ({0:.1f}%)".format(100*len(system_con_dict)/len(h.con_route_list)) + \
-                                         ", clinched: " + str(con_routes_clinched) + " of " + \
-                                         str(len(h.con_route_list)) + \
-                                         " ({0:.1f}%)".format(100*con_routes_clinched/len(h.con_route_list)) + \
-                                         ".")
-
-
-    # grand summary, active only
-    t.log_entries.append("Traveled " + str(t.active_systems_traveled) + " of " + str(active_systems) +
-                         " ({0:.1f}%)".format(100*t.active_systems_traveled/active_systems) +
-                         ", Clinched " + str(t.active_systems_clinched) + " of " + str(active_systems) +
-                         " ({0:.1f}%)".format(100*t.active_systems_clinched/active_systems) +
-                         " active systems")
-    # grand summary, active+preview
-    t.log_entries.append("Traveled " + str(t.preview_systems_traveled) + " of " + str(preview_systems) +
-                         " ({0:.1f}%)".format(100*t.preview_systems_traveled/preview_systems) +
-                         ", Clinched " + str(t.preview_systems_clinched) + " of " + str(preview_systems) +
-                         " ({0:.1f}%)".format(100*t.preview_systems_clinched/preview_systems) +
-                         " preview systems")
-print("!", flush=True)
+    # write log files for traveler lists
+    profile.phase("traveler_logs")
+    print(et.et() + "Writing traveler list logs.",flush=True)
+    # the log files are independent, so with more than one thread they are
+    # written by threads taking travelers from a shared list
+    if num_threads > 1:
+        t_lock = threading.Lock()
+        t_list = traveler_lists[::-1]
+        thread_list = []
+        for i in range(num_threads):
+            thread_list.append(WriteLogThread(i, t_list, t_lock, args.logfilepath+"/users"))
+        for thread in thread_list:
+            thread.start()
+        for thread in thread_list:
+            thread.join()
+    else:
+        for t in traveler_lists:
+            t.write_log(args.logfilepath+"/users")
+
+    # write stats csv files
+    profile.phase("stats_csv")
+    print(et.et() + "Writing stats csv files.",flush=True)
 
-# write log files for traveler lists
-print(et.et() + "Writing traveler list logs.",flush=True)
-for t in traveler_lists:
-    t.write_log(args.logfilepath+"/users")
-
-# write stats csv files
-print(et.et() + "Writing stats csv files.",flush=True)
-
-# first, overall per traveler by region, both active only and active+preview
-allfile = open(args.csvstatfilepath + "/allbyregionactiveonly.csv","w",encoding='UTF-8')
-allfile.write("Traveler,Total")
-regions = sorted(active_only_mileage_by_region.keys())
-for region in regions:
-    allfile.write(',' + region)
-allfile.write('\n')
-for t in traveler_lists:
-    allfile.write(t.traveler_name + ",{0:.2f}".format(math.fsum(list(t.active_only_mileage_by_region.values()))))
+    # first, overall per traveler by region, both active only and active+preview
+    allfile = open(args.csvstatfilepath + "/allbyregionactiveonly.csv","w",encoding='UTF-8')
+    allfile.write("Traveler,Total")
+    regions = sorted(active_only_mileage_by_region.keys())
     for region in regions:
-        if region in t.active_only_mileage_by_region.keys():
-            allfile.write(',{0:.2f}'.format(t.active_only_mileage_by_region[region]))
-        else:
-            allfile.write(',0')
+        allfile.write(',' + region)
     allfile.write('\n')
-allfile.write('TOTAL,{0:.2f}'.format(math.fsum(list(active_only_mileage_by_region.values()))))
-for region in regions:
-    allfile.write(',{0:.2f}'.format(active_only_mileage_by_region[region]))
-allfile.write('\n')
-allfile.close()
-
-# active+preview
-allfile = open(args.csvstatfilepath + "/allbyregionactivepreview.csv","w",encoding='UTF-8')
-allfile.write("Traveler,Total")
-regions = sorted(active_preview_mileage_by_region.keys())
-for region in regions:
-    allfile.write(',' + region)
-allfile.write('\n')
-for t in traveler_lists:
-    allfile.write(t.traveler_name + ",{0:.2f}".format(math.fsum(list(t.active_preview_mileage_by_region.values()))))
+    for t in traveler_lists:
+        allfile.write(t.traveler_name + ",{0:.2f}".format(math.fsum(list(t.active_only_mileage_by_region.values()))))
+        for region in regions:
+            if region in t.active_only_mileage_by_region.keys():
+                allfile.write(',{0:.2f}'.format(t.active_only_mileage_by_region[region]))
+            else:
+                allfile.write(',0')
+        allfile.write('\n')
+    allfile.write('TOTAL,{0:.2f}'.format(math.fsum(list(active_only_mileage_by_region.values()))))
     for region in regions:
-        if region in t.active_preview_mileage_by_region.keys():
-            allfile.write(',{0:.2f}'.format(t.active_preview_mileage_by_region[region]))
-        else:
-            allfile.write(',0')
+        allfile.write(',{0:.2f}'.format(active_only_mileage_by_region[region]))
     allfile.write('\n')
-allfile.write('TOTAL,{0:.2f}'.format(math.fsum(list(active_preview_mileage_by_region.values()))))
-for region in regions:
-    allfile.write(',{0:.2f}'.format(active_preview_mileage_by_region[region]))
-allfile.write('\n')
-allfile.close()
+    allfile.close()
 
-# now, a file for each system, again per traveler by region
-for h in highway_systems:
-    sysfile = open(args.csvstatfilepath + "/" + h.systemname + '-all.csv',"w",encoding='UTF-8')
-    sysfile.write('Traveler,Total')
-    regions = sorted(h.mileage_by_region.keys())
+    # active+preview
+    allfile = open(args.csvstatfilepath + "/allbyregionactivepreview.csv","w",encoding='UTF-8')
+    allfile.write("Traveler,Total")
+    regions = sorted(active_preview_mileage_by_region.keys())
     for region in regions:
-        sysfile.write(',' + region)
-    sysfile.write('\n')
+        allfile.write(',' + region)
+    allfile.write('\n')
     for t in traveler_lists:
-        # only include entries for travelers who have any mileage in system
-        if h.systemname in t.system_region_mileages:
-            sysfile.write(t.traveler_name + ",{0:.2f}".format(math.fsum(list(t.system_region_mileages[h.systemname].values()))))
-            for region in regions:
-                if region in t.system_region_mileages[h.systemname]:
-                    sysfile.write(',{0:.2f}'.format(t.system_region_mileages[h.systemname][region]))
-                else:
-                    sysfile.write(',0')
-            sysfile.write('\n')
-    sysfile.write('TOTAL,{0:.2f}'.format(math.fsum(list(h.mileage_by_region.values()))))
+        allfile.write(t.traveler_name + ",{0:.2f}".format(math.fsum(list(t.active_preview_mileage_by_region.values()))))
+        for region in regions:
+            if region in t.active_preview_mileage_by_region.keys():
+                allfile.write(',{0:.2f}'.format(t.active_preview_mileage_by_region[region]))
+            else:
+                allfile.write(',0')
+        allfile.write('\n')
+    allfile.write('TOTAL,{0:.2f}'.format(math.fsum(list(active_preview_mileage_by_region.values()))))
     for region in regions:
-        sysfile.write(',{0:.2f}'.format(h.mileage_by_region[region]))
-    sysfile.write('\n')
-    sysfile.close()
+        allfile.write(',{0:.2f}'.format(active_preview_mileage_by_region[region]))
+    allfile.write('\n')
+    allfile.close()
+
+    # now, a file for each system, again per traveler by region
+    for h in highway_systems:
+        sysfile = open(args.csvstatfilepath + "/" + h.systemname + '-all.csv',"w",encoding='UTF-8')
+        sysfile.write('Traveler,Total')
+        regions = sorted(h.mileage_by_region.keys())
+        for region in regions:
+            sysfile.write(',' + region)
+        sysfile.write('\n')
+        for t in traveler_lists:
+            # only include entries for travelers who have any mileage in system
+            if h.systemname in t.system_region_mileages:
+                sysfile.write(t.traveler_name + ",{0:.2f}".format(math.fsum(list(t.system_region_mileages[h.systemname].values()))))
+                for region in regions:
+                    if region in t.system_region_mileages[h.systemname]:
+                        sysfile.write(',{0:.2f}'.format(t.system_region_mileages[h.systemname][region]))
+                    else:
+                        sysfile.write(',0')
+                sysfile.write('\n')
+        sysfile.write('TOTAL,{0:.2f}'.format(math.fsum(list(h.mileage_by_region.values()))))
+        for region in regions:
+            sysfile.write(',{0:.2f}'.format(h.mileage_by_region[region]))
+        sysfile.write('\n')
+        sysfile.close()
 
 # read in the datacheck false positives list
+profile.phase("read_datacheckfps")
 print(et.et() + "Reading datacheckfps.csv.",flush=True)
 with open(args.highwaydatapath+"/datacheckfps.csv", "rt",encoding='utf-8') as file:
     lines = file.readlines()
@@ -2858,6 +4695,7 @@ if len(el.error_list) > 0:
 
 # Build a graph structure out of all highway data in active and
 # preview systems
+profile.phase("graphs")
 print(et.et() + "Setting up for graphs of highway data.", flush=True)
 graph_data = HighwayGraph(all_waypoints, highway_systems, datacheckerrors)
 
@@ -2876,6 +4714,9 @@ graph_types = []
 
 if args.skipgraphs or args.errorcheck:
     print(et.et() + "SKIPPING generation of subgraphs.", flush=True)
+    # any subgraphs written by an earlier run are left as they were
+    if state is not None:
+        state.current['graphs'] = state.section('graphs')
 else:
     print(et.et() + "Writing master TM simple graph file, tm-master-simple.tmg", flush=True)
     (sv, se) = graph_data.write_master_tmg_simple(args.graphfilepath+'/tm-master-simple.tmg')
@@ -2886,6 +4727,13 @@ else:
     graph_types.append(['master', 'All Travel Mapping Data',
                         'These graphs contain all routes currently plotted in the Travel Mapping project.'])
 
+    # With an update state, subgraphs with the same vertices and edges
+    # as when last written use the files written then
+    if state is not None:
+        print(et.et() + "Finding subgraphs unchanged since update state was written.", flush=True)
+        state.current['graphs'] = dict()
+        graph_data.reuse_subgraphs(state.section('graphs'), state.current['graphs'], args.previousgraphpath)
+
     # graphs restricted by place/area - from areagraphs.csv file
     print("\n" + et.et() + "Creating area data graphs.", flush=True)
     with open(args.highwaydatapath+"/graphs/areagraphs.csv", "rt",encoding='utf-8') as file:
@@ -3034,178 +4882,227 @@ else:
     graph_types.append(['continent', 'Routes Within a Continent',
                         'These graphs contain the routes on a continent.'])
     print("!")
+    if state is not None:
+        print(et.et() + str(graph_data.reused_subgraph_count) + " unchanged subgraphs used again.", flush=True)
 
 # data check: visit each system and route and check for various problems
-print(et.et() + "Performing data checks.",end="",flush=True)
-# perform most datachecks here (list initialized above)
-for h in highway_systems:
-    print(".",end="",flush=True)
-    for r in h.route_list:
-        # set to be used per-route to find label duplicates
-        all_route_labels = set()
-        # set of tuples to be used for finding duplicate coordinates
-        coords_used = set()
-
-        visible_distance = 0.0
-        # note that we assume the first point will be visible in each route
-        # so the following is simply a placeholder
-        last_visible = None
-        prev_w = None
-
-        # look for hidden termini
-        if r.point_list[0].is_hidden:
-            datacheckerrors.append(DatacheckEntry(r,[r.point_list[0].label],'HIDDEN_TERMINUS'))
-        if r.point_list[len(r.point_list)-1].is_hidden:
-            datacheckerrors.append(DatacheckEntry(r,[r.point_list[len(r.point_list)-1].label],'HIDDEN_TERMINUS'))
-
-        for w in r.point_list:
-            # duplicate labels
-            label_list = w.alt_labels.copy()
-            label_list.append(w.label)
-            for label in label_list:
-                lower_label = label.lower().strip("+*")
-                if lower_label in all_route_labels:
-                    datacheckerrors.append(DatacheckEntry(r,[lower_label],"DUPLICATE_LABEL"))
-                else:
-                    all_route_labels.add(lower_label)
-
-            # out-of-bounds coords
-            if w.lat > 90 or w.lat < -90 or w.lng > 180 or w.lng < -180:
-                datacheckerrors.append(DatacheckEntry(r,[w.label],'OUT_OF_BOUNDS',
-                                                      "("+str(w.lat)+","+str(w.lng)+")"))
-
-            # duplicate coordinates
-            latlng = w.lat, w.lng
-            if latlng in coords_used:
-                for other_w in r.point_list:
-                    if w == other_w:
-                        break
-                    if w.lat == other_w.lat and w.lng == other_w.lng and w.label != other_w.label:
-                        labels = []
-                        labels.append(other_w.label)
-                        labels.append(w.label)
-                        datacheckerrors.append(DatacheckEntry(r,labels,"DUPLICATE_COORDS",
-                                                              "("+str(latlng[0])+","+str(latlng[1])+")"))
+profile.phase("datacheck")
+# the checks of each route are independent of all others, so are
+# done by this function, which adds the errors found to datacheckerrors
+def route_datachecks(h,r,datacheckerrors):
+    # set to be used per-route to find label duplicates
+    all_route_labels = set()
+    # set of tuples to be used for finding duplicate coordinates
+    coords_used = set()
+
+    visible_distance = 0.0
+    # note that we assume the first point will be visible in each route
+    # so the following is simply a placeholder
+    last_visible = None
+    prev_w = None
+    point_index = 0
+
+    # the parts of the LABEL_SELFREF check that depend only on the
+    # route: the route's number if it ends with one, and the route
+    # and banner followed by a "_" or "/" suffix
+    route_number = None
+    if r.route[-1].isdigit():
+        digit_starts = len(r.route)-1
+        while digit_starts >= 0 and r.route[digit_starts].isdigit():
+            digit_starts-=1
+        route_number = r.route[digit_starts+1:]
+    selfref_re = re.compile(r.route+r.banner+'[_/].*')
+
+    # look for hidden termini
+    if r.point_list[0].is_hidden:
+        datacheckerrors.append(DatacheckEntry(r,[r.point_list[0].label],'HIDDEN_TERMINUS'))
+    if r.point_list[len(r.point_list)-1].is_hidden:
+        datacheckerrors.append(DatacheckEntry(r,[r.point_list[len(r.point_list)-1].label],'HIDDEN_TERMINUS'))
+
+    for w in r.point_list:
+        # duplicate labels
+        label_list = w.alt_labels.copy()
+        label_list.append(w.label)
+        for label in label_list:
+            lower_label = label.lower().strip("+*")
+            if lower_label in all_route_labels:
+                datacheckerrors.append(DatacheckEntry(r,[lower_label],"DUPLICATE_LABEL"))
             else:
-               coords_used.add(latlng)
-
-            # visible distance update, and last segment length check
-            if prev_w is not None:
-                last_distance = w.distance_to(prev_w)
-                visible_distance += last_distance
-                if last_distance > 20.0:
+                all_route_labels.add(lower_label)
+
+        # out-of-bounds coords
+        if w.lat > 90 or w.lat < -90 or w.lng > 180 or w.lng < -180:
+            datacheckerrors.append(DatacheckEntry(r,[w.label],'OUT_OF_BOUNDS',
+                                                  "("+str(w.lat)+","+str(w.lng)+")"))
+
+        # duplicate coordinates
+        latlng = w.lat, w.lng
+        if latlng in coords_used:
+            for other_w in r.point_list:
+                if w == other_w:
+                    break
+                if w.lat == other_w.lat and w.lng == other_w.lng and w.label != other_w.label:
                     labels = []
-                    labels.append(prev_w.label)
+                    labels.append(other_w.label)
                     labels.append(w.label)
-                    datacheckerrors.append(DatacheckEntry(r,labels,'LONG_SEGMENT',
-                                                          "{0:.2f}".format(last_distance)))
+                    datacheckerrors.append(DatacheckEntry(r,labels,"DUPLICATE_COORDS",
+                                                          "("+str(latlng[0])+","+str(latlng[1])+")"))
+        else:
+           coords_used.add(latlng)
 
-            if not w.is_hidden:
-                # complete visible distance check, omit report for active
-                # systems to reduce clutter
-                if visible_distance > 10.0 and not h.active():
-                    labels = []
-                    labels.append(last_visible.label)
-                    labels.append(w.label)
-                    datacheckerrors.append(DatacheckEntry(r,labels,'VISIBLE_DISTANCE',
-                                                          "{0:.2f}".format(visible_distance)))
-                last_visible = w
-                visible_distance = 0.0
-
-                # looking for the route within the label
-                #match_start = w.label.find(r.route)
-                #if match_start >= 0:
-                    # we have a potential match, just need to make sure if the route
-                    # name ends with a number that the matched substring isn't followed
-                    # by more numbers (e.g., NY50 is an OK label in NY5)
-                #    if len(r.route) + match_start == len(w.label) or \
-                #            not w.label[len(r.route) + match_start].isdigit():
-                # partially complete "references own route" -- too many FP
-                #or re.fullmatch('.*/'+r.route+'.*',w.label[w.label) :
-                # first check for number match after a slash, if there is one
-                selfref_found = False
-                if '/' in w.label and r.route[-1].isdigit():
-                    digit_starts = len(r.route)-1
-                    while digit_starts >= 0 and r.route[digit_starts].isdigit():
-                        digit_starts-=1
-                    if w.label[w.label.index('/')+1:] == r.route[digit_starts+1:]:
-                        selfref_found = True
-                    if w.label[w.label.index('/')+1:] == r.route:
-                        selfref_found = True
-                    if '_' in w.label[w.label.index('/')+1:] and w.label[w.label.index('/')+1:w.label.rindex('_')] == r.route[digit_starts+1:]:
-                        selfref_found = True
-                    if '_' in w.label[w.label.index('/')+1:] and w.label[w.label.index('/')+1:w.label.rindex('_')] == r.route:
-                        selfref_found = True
-
-                # now the remaining checks
-                if selfref_found or r.route+r.banner == w.label or re.fullmatch(r.route+r.banner+'[_/].*',w.label):
-                    datacheckerrors.append(DatacheckEntry(r,[w.label],'LABEL_SELFREF'))
-
-                # look for too many underscores in label
-                if w.label.count('_') > 1:
-                    datacheckerrors.append(DatacheckEntry(r,[w.label],'LABEL_UNDERSCORES'))
-
-                # look for too many characters after underscore in label
-                if '_' in w.label:
-                    if w.label.index('_') < len(w.label) - 5:
-                        datacheckerrors.append(DatacheckEntry(r,[w.label],'LONG_UNDERSCORE'))
-
-                # look for too many slashes in label
-                if w.label.count('/') > 1:
-                    datacheckerrors.append(DatacheckEntry(r,[w.label],'LABEL_SLASHES'))
-
-                # look for parenthesis balance in label
-                if w.label.count('(') != w.label.count(')'):
-                    datacheckerrors.append(DatacheckEntry(r,[w.label],'LABEL_PARENS'))
-
-                # look for labels with invalid characters
-                if not re.fullmatch('[a-zA-Z0-9()/\+\*_\-\.]+', w.label):
-                    datacheckerrors.append(DatacheckEntry(r,[w.label],'LABEL_INVALID_CHAR'))
-                for a in w.alt_labels:
-                    if not re.fullmatch('[a-zA-Z0-9()/\+\*_\-\.]+', a):
-                        datacheckerrors.append(DatacheckEntry(r,[a],'LABEL_INVALID_CHAR'))
-
-                # look for labels with a slash after an underscore
-                if '_' in w.label and '/' in w.label and \
-                        w.label.index('/') > w.label.index('_'):
-                    datacheckerrors.append(DatacheckEntry(r,[w.label],'NONTERMINAL_UNDERSCORE'))
-
-                # look for I-xx with Bus instead of BL or BS
-                if re.fullmatch('I\-[0-9]*Bus', w.label):
-                    datacheckerrors.append(DatacheckEntry(r,[w.label],'BUS_WITH_I'))
-
-                # look for labels that look like hidden waypoints but
-                # which aren't hidden
-                if re.fullmatch('X[0-9][0-9][0-9][0-9][0-9][0-9]', w.label):
-                    datacheckerrors.append(DatacheckEntry(r,[w.label],'LABEL_LOOKS_HIDDEN'))
-
-                # look for USxxxA but not USxxxAlt, B/Bus (others?)
-                ##if re.fullmatch('US[0-9]+A.*', w.label) and not re.fullmatch('US[0-9]+Alt.*', w.label) or \
-                ##   re.fullmatch('US[0-9]+B.*', w.label) and \
-                ##   not (re.fullmatch('US[0-9]+Bus.*', w.label) or re.fullmatch('US[0-9]+Byp.*', w.label)):
-                ##    datacheckerrors.append(DatacheckEntry(r,[w.label],'US_BANNER'))
-
-            prev_w = w
-
-        # angle check is easier with a traditional for loop and array indices
-        for i in range(1, len(r.point_list)-1):
-            #print("computing angle for " + str(r.point_list[i-1]) + ' ' + str(r.point_list[i]) + ' ' + str(r.point_list[i+1]))
-            if r.point_list[i-1].same_coords(r.point_list[i]) or \
-               r.point_list[i+1].same_coords(r.point_list[i]):
+        # visible distance update, and last segment length check
+        if prev_w is not None:
+            last_distance = r.segment_list[point_index-1].length()
+            visible_distance += last_distance
+            if last_distance > 20.0:
+                labels = []
+                labels.append(prev_w.label)
+                labels.append(w.label)
+                datacheckerrors.append(DatacheckEntry(r,labels,'LONG_SEGMENT',
+                                                      "{0:.2f}".format(last_distance)))
+
+        if not w.is_hidden:
+            # complete visible distance check, omit report for active
+            # systems to reduce clutter
+            if visible_distance > 10.0 and not h.active():
+                labels = []
+                labels.append(last_visible.label)
+                labels.append(w.label)
+                datacheckerrors.append(DatacheckEntry(r,labels,'VISIBLE_DISTANCE',
+                                                      "{0:.2f}".format(visible_distance)))
+            last_visible = w
+            visible_distance = 0.0
+
+            # looking for the route within the label
+            #match_start = w.label.find(r.route)
+            #if match_start >= 0:
+                # we have a potential match, just need to make sure if the route
+                # name ends with a number that the matched substring isn't followed
+                # by more numbers (e.g., NY50 is an OK label in NY5)
+            #    if len(r.route) + match_start == len(w.label) or \
+            #            not w.label[len(r.route) + match_start].isdigit():
+            # partially complete "references own route" -- too many FP
+            #or re.fullmatch('.*/'+r.route+'.*',w.label[w.label) :
+            # first check for number match after a slash, if there is one
+            features = LabelFeatures(w.label)
+            selfref_found = False
+            if route_number is not None and features.first_slash >= 0:
+                after_slash = w.label[features.first_slash+1:]
+                if after_slash == route_number or after_slash == r.route:
+                    selfref_found = True
+                if '_' in after_slash and \
+                   after_slash[:after_slash.rindex('_')] in (route_number, r.route):
+                    selfref_found = True
+
+            # now the remaining checks
+            if selfref_found or r.route+r.banner == w.label or selfref_re.fullmatch(w.label):
+                datacheckerrors.append(DatacheckEntry(r,[w.label],'LABEL_SELFREF'))
+
+            for (code, has_error) in label_datacheck_rules:
+                if has_error(features):
+                    datacheckerrors.append(DatacheckEntry(r,[w.label],code))
+
+            # alt labels are checked only for invalid characters
+            for a in w.alt_labels:
+                if not LabelFeatures.valid_chars_re.fullmatch(a):
+                    datacheckerrors.append(DatacheckEntry(r,[a],'LABEL_INVALID_CHAR'))
+
+            # look for USxxxA but not USxxxAlt, B/Bus (others?)
+            ##if re.fullmatch('US[0-9]+A.*', w.label) and not re.fullmatch('US[0-9]+Alt.*', w.label) or \
+            ##   re.fullmatch('US[0-9]+B.*', w.label) and \
+            ##   not (re.fullmatch('US[0-9]+Bus.*', w.label) or re.fullmatch('US[0-9]+Byp.*', w.label)):
+            ##    datacheckerrors.append(DatacheckEntry(r,[w.label],'US_BANNER'))
+
+        prev_w = w
+        point_index += 1
+
+    # angle check is easier with a traditional for loop and array indices,
+    # over only the points that numpy finds could be errors if available
+    if numpy is not None:
+        angle_check_points = angle_datacheck_candidates(r.point_list)
+    else:
+        angle_check_points = range(1, len(r.point_list)-1)
+    for i in angle_check_points:
+        #print("computing angle for " + str(r.point_list[i-1]) + ' ' + str(r.point_list[i]) + ' ' + str(r.point_list[i+1]))
+        if r.point_list[i-1].same_coords(r.point_list[i]) or \
+           r.point_list[i+1].same_coords(r.point_list[i]):
+            labels = []
+            labels.append(r.point_list[i-1].label)
+            labels.append(r.point_list[i].label)
+            labels.append(r.point_list[i+1].label)
+            datacheckerrors.append(DatacheckEntry(r,labels,'BAD_ANGLE'))
+        else:
+            angle = r.point_list[i].angle(r.point_list[i-1],r.point_list[i+1])
+            if angle > 135:
                 labels = []
                 labels.append(r.point_list[i-1].label)
                 labels.append(r.point_list[i].label)
                 labels.append(r.point_list[i+1].label)
-                datacheckerrors.append(DatacheckEntry(r,labels,'BAD_ANGLE'))
+                datacheckerrors.append(DatacheckEntry(r,labels,'SHARP_ANGLE',
+                                                      "{0:.2f}".format(angle)))
+
+# With an update state, the errors found in each route unchanged since
+# it was written are those kept in it, as (labels, code, info) by root
+previous_datachecks = state.section('datachecks') if incremental else dict()
+unchanged_datachecks = dict()
+for root in previous_datachecks:
+    if root in route_by_root and route_by_root[root] not in dirty_routes:
+        unchanged_datachecks[route_by_root[root]] = previous_datachecks[root]
+previous_datachecks = None
+if state is not None:
+    state.current['datachecks'] = dict()
+
+# worker process version: the checks of each system's routes are done
+# in parallel, returning the (route index, labels, code, info) of each
+# error, to be recreated as DatacheckEntry objects in system order
+def datacheck_records_for_highway_system(h_num):
+    h = highway_systems[h_num]
+    records = []
+    for r_num in range(len(h.route_list)):
+        if h.route_list[r_num] in unchanged_datachecks:
+            continue
+        route_errors = []
+        route_datachecks(h,h.route_list[r_num],route_errors)
+        for d in route_errors:
+            records.append((r_num, d.labels, d.code, d.info))
+    return records
+
+print(et.et() + "Performing data checks.",end="",flush=True)
+# perform most datachecks here (list initialized above)
+if num_processes > 0:
+    pool = process_context.Pool(num_processes)
+    for (h, h_records) in zip(highway_systems,
+                              pool.imap(datacheck_records_for_highway_system,
+                                        range(len(highway_systems)))):
+        print(".",end="",flush=True)
+        route_records = [[] for r in h.route_list]
+        for (r_num, labels, code, info) in h_records:
+            route_records[r_num].append((labels, code, info))
+        for r_num in range(len(h.route_list)):
+            r = h.route_list[r_num]
+            if r in unchanged_datachecks:
+                route_records[r_num] = unchanged_datachecks[r]
+            for (labels, code, info) in route_records[r_num]:
+                datacheckerrors.append(DatacheckEntry(r,labels,code,info))
+            if state is not None:
+                state.current['datachecks'][r.root] = route_records[r_num]
+    pool.close()
+    pool.join()
+else:
+    for h in highway_systems:
+        print(".",end="",flush=True)
+        for r in h.route_list:
+            if r in unchanged_datachecks:
+                route_records = unchanged_datachecks[r]
+                for (labels, code, info) in route_records:
+                    datacheckerrors.append(DatacheckEntry(r,labels,code,info))
             else:
-                angle = r.point_list[i].angle(r.point_list[i-1],r.point_list[i+1])
-                if angle > 135:
-                    labels = []
-                    labels.append(r.point_list[i-1].label)
-                    labels.append(r.point_list[i].label)
-                    labels.append(r.point_list[i+1].label)
-                    datacheckerrors.append(DatacheckEntry(r,labels,'SHARP_ANGLE',
-                                                          "{0:.2f}".format(angle)))
+                route_errors = []
+                route_datachecks(h,r,route_errors)
+                datacheckerrors.extend(route_errors)
+                route_records = [(d.labels, d.code, d.info) for d in route_errors]
+            if state is not None:
+                state.current['datachecks'][r.root] = route_records
 print("!", flush=True)
 print(et.et() + "Found " + str(len(datacheckerrors)) + " datacheck errors.")
 
@@ -3215,7 +5112,20 @@ datacheckerrors.sort(key=lambda DatacheckEntry: str(DatacheckEntry))
 print(et.et() + "Marking datacheck false positives.",end="",flush=True)
 fpfile = open(args.logfilepath+'/nearmatchfps.log','w',encoding='utf-8')
 fpfile.write("Log file created at: " + str(datetime.datetime.now()) + "\n")
-toremove = []
+# index the FP entries by the fields an error must match, as in
+# DatacheckEntry.match_except_info: the root, the code, and as many
+# labels as the error has, so each error is compared only with the
+# entries it matches, still in file order.  Matched entries are
+# replaced by None in datacheckfps.
+datacheckfp_index = [dict(), dict(), dict(), dict()]
+for fp_num in range(len(datacheckfps)):
+    fp = datacheckfps[fp_num]
+    for num_labels in range(4):
+        key = (fp[0], fp[4]) + tuple(fp[1:1+num_labels])
+        if key in datacheckfp_index[num_labels]:
+            datacheckfp_index[num_labels][key].append(fp_num)
+        else:
+            datacheckfp_index[num_labels][key] = [fp_num]
 counter = 0
 fpcount = 0
 for d in datacheckerrors:
@@ -3223,18 +5133,21 @@ for d in datacheckerrors:
     counter += 1
     if counter % 1000 == 0:
         print(".", end="",flush=True)
-    for fp in datacheckfps:
-        #print("Comparing: " + str(d) + " to " + str(fp))
-        if d.match_except_info(fp):
+    key = (d.route.root, d.code) + tuple(d.labels[:3])
+    for fp_num in datacheckfp_index[len(key)-2].get(key, ()):
+        fp = datacheckfps[fp_num]
+        if fp is not None:
             if d.info == fp[5]:
                 #print("Match!")
                 d.fp = True
                 fpcount += 1
-                datacheckfps.remove(fp)
+                datacheckfps[fp_num] = None
                 break
             fpfile.write("FP_ENTRY: " + fp[0] + ';' + fp[1] + ';' + fp[2] + ';' + fp[3] + ';' + fp[4] + ';' + fp[5] + '\n')
             fpfile.write("CHANGETO: " + fp[0] + ';' + fp[1] + ';' + fp[2] + ';' + fp[3] + ';' + fp[4] + ';' + d.info + '\n')
 fpfile.close()
+datacheckfp_index = None
+datacheckfps = [fp for fp in datacheckfps if fp is not None]
 print("!", flush=True)
 print(et.et() + "Matched " + str(fpcount) + " FP entries.", flush=True)
 
@@ -3251,19 +5164,18 @@ fpfile.close()
 
 # datacheck.log file
 print(et.et() + "Writing datacheck.log")
-logfile = open(args.logfilepath + '/datacheck.log', 'w')
-logfile.write("Log file created at: " + str(datetime.datetime.now()) + "\n")
+logfile = LogFile(args.logfilepath + '/datacheck.log')
+logfile.write_header()
 logfile.write("Datacheck errors that have been flagged as false positives are not included.\n")
 logfile.write("These entries should be in a format ready to paste into datacheckfps.csv.\n")
 logfile.write("Root;Waypoint1;Waypoint2;Waypoint3;Error;Info\n")
 if len(datacheckerrors) > 0:
-    for d in datacheckerrors:
-        if not d.fp:
-            logfile.write(str(d)+"\n")
+    logfile.write_lines(str(d) for d in datacheckerrors if not d.fp)
 else:
     logfile.write("No datacheck errors found.")
 logfile.close()
     
+profile.phase("sql")
 if args.errorcheck:
     print(et.et() + "SKIPPING database file.")
 else:
@@ -3421,7 +5333,7 @@ else:
                     sqlfile.write(",")
                 first = False
                 sqlfile.write("(" + s.csv_line(segment_num) + ")\n")
-                for t in s.clinched_by:
+                for t in s.clinched_by_travelers(traveler_lists):
                     clinched_list.append("'" + str(segment_num) + "','" + t.traveler_name + "'")
                 segment_num += 1
             sqlfile.write(";\n")
@@ -3604,7 +5516,15 @@ else:
 
     sqlfile.close()
 
+# the update state is written last, so it is only kept from runs that
+# have written everything it could be used to reproduce
+if state is not None:
+    print(et.et() + "Writing update state file " + args.statefile + ".", flush=True)
+    state.save()
+    state = None
+
 # print some statistics
+profile.phase("summary_stats")
 print(et.et() + "Processed " + str(len(highway_systems)) + " highway systems.")
 routes = 0
 points = 0